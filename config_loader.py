@@ -1,11 +1,34 @@
 import json
+import os
 
 from models.api_manager import APIManager
+from schemas import SettingsModel
+from services.counter_store import CounterStore
+from services.request_journal import RequestJournal
+from services.session_pool import SessionPool
+from services.state_backends import create_state_backend
 
 
-def load_configs(stop_event):
-    with open("apis.json", "r", encoding="utf8") as f:
+# Путь к конфигурации можно переопределить, например, чтобы запустить лимитер с тестовым набором API
+CONFIG_PATH_ENV = "RATELIMITER_CONFIG"
+
+
+def load_configs(stop_event, session_pool: SessionPool):
+    with open(os.environ.get(CONFIG_PATH_ENV, "apis.json"), "r", encoding="utf8") as f:
         data = json.load(f)
-    api_manager = APIManager(data["sources"], stop_event)
+    settings = SettingsModel(**data.get("settings", {}))
+    # Счётчики RPD восстанавливаются из файла до создания API, чтобы первый же запрос учитывал прошлый расход
+    counter_store = None
+    if settings.persist_counters and settings.state_backend == "local":
+        counter_store = CounterStore(settings.counters_path, settings.counters_flush_interval)
+    state_backend = create_state_backend(settings, counter_store)
+    # Запросы долговечных API, не выполненные до остановки, снова ставятся в очереди.
+    # Без долговечных API журнал не создаётся: каталог не нужен, а сервис не платит за фоновую запись
+    journal, unfinished = None, []
+    if any(cfg.get("rate_limit", {}).get("durable") for cfg in data["sources"]):
+        journal = RequestJournal(settings.journal_path, settings.journal_segment_size)
+        unfinished = journal.recover()
+    api_manager = APIManager(data["sources"], stop_event, session_pool, state_backend, settings, journal)
     api_manager.start()
-    return api_manager
\ No newline at end of file
+    api_manager.replay(unfinished)
+    return api_manager
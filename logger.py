@@ -1,5 +1,24 @@
+"""
+Логгеры модулей: консоль и файл logs/app.log с ротацией.
+
+Логгеры создаются при импорте модулей, до чтения apis.json, поэтому режим задаётся переменными окружения:
+- RATELIMITER_LOG_MODE: sync (по умолчанию) - запись в потоке, который логирует;
+  async - записи уходят в очередь, фоновый поток пишет их пачками, event loop не ждёт диска и консоли
+- RATELIMITER_LOG_FORMAT: text (по умолчанию) или json - по объекту JSON на строку
+- RATELIMITER_LOG_LEVEL: уровень логгеров модулей, по умолчанию INFO
+- RATELIMITER_LOG_RATE_LIMITS: ограничение частых сообщений, например "models.api=50,routers.api_router=20" -
+  не больше 50 записей в секунду ниже WARNING от логгера models.api; пропущенные учитываются в следующей записи
+"""
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
 import sys
+import threading
+import time
+from datetime import datetime, timezone
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
@@ -8,18 +27,174 @@ LOG_DIR.mkdir(exist_ok=True)
 
 LOG_FILE = LOG_DIR / "app.log"
 
+LOG_MODE = os.environ.get("RATELIMITER_LOG_MODE", "sync").lower()
+LOG_FORMAT = os.environ.get("RATELIMITER_LOG_FORMAT", "text").lower()
+LOG_LEVEL = os.environ.get("RATELIMITER_LOG_LEVEL", "INFO").upper()
 
-def setup_logger(name: str = "app", level=logging.INFO) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
+# Сколько записей фоновый поток пишет за один раз
+BATCH_SIZE = 1000
 
-    if logger.handlers:
-        return logger
+# Пауза фонового потока между пачками: записи копятся, и поток реже отнимает GIL у event loop
+FLUSH_INTERVAL = 0.1
 
-    formatter = logging.Formatter(
-        fmt="%(asctime)s [%(levelname)s] [%(name)s] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
+
+def _parse_rate_limits(value: str) -> dict[str, float]:
+    limits = {}
+    for part in value.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            limits[name.strip()] = float(rate)
+    return limits
+
+
+RATE_LIMITS = _parse_rate_limits(os.environ.get("RATELIMITER_LOG_RATE_LIMITS", ""))
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись одной строкой JSON: время, уровень, логгер, сообщение и, если есть, исключение."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Асинхронный режим: исключение уже переведено в текст в потоке, который логировал
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Пропускает не больше rate записей в секунду ниже WARNING (корзина токенов с запасом на секунду).
+
+    Число отброшенных записей сохраняется в атрибуте suppressed следующей пропущенной.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self._rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self._rate, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        if self._tokens < 1:
+            self._dropped += 1
+            return False
+        self._tokens -= 1
+        if self._dropped:
+            record.suppressed, self._dropped = self._dropped, 0
+        return True
+
+
+# Переводит исключение в текст до постановки записи в очередь
+_EXC_FORMATTER = logging.Formatter()
+
+
+class _QueueHandler(logging.Handler):
+    """
+    Кладёт запись в очередь фонового потока.
+
+    Как logging.handlers.QueueHandler.prepare, "%"-аргументы подставляются и исключение переводится в текст сразу:
+    изменяемый аргумент, изменённый после вызова, иначе попал бы в лог с новым значением.
+    Оформление строки (время, уровень, JSON) и запись остаются фоновому потоку.
+    """
+
+    def __init__(self, records: queue.SimpleQueue):
+        super().__init__()
+        self._records = records
+
+    def handle(self, record):
+        # Блокировка обработчика не нужна: SimpleQueue потокобезопасна
+        if self.filter(record):
+            self._records.put_nowait(self.prepare(record))
+        return True
+
+    def emit(self, record):
+        self._records.put_nowait(self.prepare(record))
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Копия: ту же запись могут получить обработчики родительских логгеров
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _BatchWriter(threading.Thread):
+    """Фоновый поток: забирает записи из очереди пачками и пишет каждую пачку в обработчик одной операцией."""
+
+    def __init__(self, handlers: list[logging.StreamHandler]):
+        super().__init__(name="log-writer", daemon=True)
+        self.records: queue.SimpleQueue = queue.SimpleQueue()
+        self._handlers = handlers
+
+    def run(self):
+        while True:
+            batch = [self.records.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            records = [item for item in batch if isinstance(item, logging.LogRecord)]
+            if records:
+                self._write(records)
+            # Кроме записей в очереди бывают отметки flush_logs (Event) и остановки (None)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is None for item in batch):
+                return
+            time.sleep(FLUSH_INTERVAL)
+
+    def _write(self, batch: list[logging.LogRecord]) -> None:
+        for handler in self._handlers:
+            try:
+                lines = [handler.format(record) + handler.terminator for record in batch]
+                with handler.lock:
+                    if isinstance(handler, RotatingFileHandler):
+                        for line in lines:
+                            if handler.maxBytes > 0 and handler.stream.tell() + len(line) >= handler.maxBytes:
+                                handler.stream.flush()
+                                handler.doRollover()
+                            handler.stream.write(line)
+                    else:
+                        handler.stream.write("".join(lines))
+                    handler.flush()
+            except Exception:
+                # Ошибка записи не должна останавливать поток: как и logging, сообщаем в stderr и продолжаем
+                handler.handleError(batch[0])
+
+    def stop(self):
+        self.records.put_nowait(None)
+        self.join(timeout=5)
+
+
+def _make_handlers() -> list[logging.StreamHandler]:
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt="%(asctime)s [%(levelname)s] [%(name)s] %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
 
     # === Консоль ===
     console_handler = logging.StreamHandler(sys.stdout)
@@ -30,8 +205,50 @@ def setup_logger(name: str = "app", level=logging.INFO) -> logging.Logger:
         LOG_FILE, maxBytes=5_000_000, backupCount=5, encoding="utf-8"
     )
     file_handler.setFormatter(formatter)
+    return [console_handler, file_handler]
+
+
+_writer = None
+
+
+def _queue_handler() -> logging.Handler:
+    """Обработчик асинхронного режима, общий для всех логгеров; фоновый поток запускается при первом вызове."""
+    global _writer
+    if _writer is None:
+        _writer = _BatchWriter(_make_handlers())
+        _writer.start()
+        # Записи, оставшиеся в очереди, дописываются при выходе
+        atexit.register(_writer.stop)
+    return _QueueHandler(_writer.records)
+
+
+def flush_logs(timeout: float = 5.0) -> None:
+    """
+    Дожидается, пока фоновый поток запишет все сообщения, уже поставленные в очередь.
+
+    Нужен при остановке: после SIGTERM uvicorn завершает процесс сигналом, и atexit не выполняется.
+    В синхронном режиме ничего не делает.
+    """
+    if _writer is not None and _writer.is_alive():
+        written = threading.Event()
+        _writer.records.put_nowait(written)
+        written.wait(timeout)
+
+
+def setup_logger(name: str = "app", level=None) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(level if level is not None else LOG_LEVEL)
+
+    if logger.handlers:
+        return logger
+
+    if name in RATE_LIMITS:
+        logger.addFilter(RateLimitFilter(RATE_LIMITS[name]))
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    if LOG_MODE == "async":
+        logger.addHandler(_queue_handler())
+    else:
+        for handler in _make_handlers():
+            logger.addHandler(handler)
 
-    return logger
\ No newline at end of file
+    return logger
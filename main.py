@@ -9,7 +9,8 @@ from fastapi import FastAPI
 
 from config_loader import load_configs
 from routers import admin_router, api_router
-from logger import setup_logger
+from logger import flush_logs, setup_logger
+from services.session_pool import SessionPool
 
 logger = setup_logger(__name__)
 
@@ -19,12 +20,14 @@ async def lifespan(app: FastAPI):
     """
     Управление жизненным циклом приложения.
     
-    Инициализирует API менеджер при старте и корректно останавливает все задачи при завершении.
+    Инициализирует API менеджер и пул HTTP-сессий при старте и корректно останавливает все задачи
+    и закрывает соединения при завершении.
     """
     stop_event = asyncio.Event()
+    session_pool = SessionPool()
     
     # Загружаем конфигурации и создаём API менеджер
-    api_manager = load_configs(stop_event)
+    api_manager = load_configs(stop_event, session_pool)
     
     # Сохраняем в app.state для доступа из роутеров
     app.state.api_manager = api_manager
@@ -34,9 +37,10 @@ async def lifespan(app: FastAPI):
     
     # Останавливаем все фоновые задачи
     logger.info("Setting stop event")
-    stop_event.set()
-    await asyncio.sleep(0)
+    await api_manager.stop()
+    await session_pool.close()
     logger.info("DONE")
+    flush_logs()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -1,48 +1,540 @@
 import asyncio
-from random import random
+import math
+from dataclasses import dataclass, field
+from typing import Any, Optional
 
+import aiohttp
+from fastapi.responses import JSONResponse, Response
+
+from models.proxy_request import ProxyRequest
 from schemas import APIModel
-from services.requester import make_request
+from services.clock import SYSTEM_CLOCK, Clock
+from services.concurrency import ConcurrencyLimiter, SlotReleasingBody
+from services.metrics import APIMetrics
+from services.quota_schedules import QuotaCounter, build_schedule
+from services.rate_limit_headers import parse_rate_limit_headers
+from services.rate_limits import RateLimiter
+from services.request_journal import RequestJournal, decode_body, encode_body
+from services.requester import discard_response, make_request
+from services.response_cache import ResponseCache, parse_cache_control
+from services.scheduling import build_queue
+from services.session_pool import SessionPool
+from services.state_backends import StateBackend
 
 from logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Пауза перед повтором, если хранилище состояния лимитов недоступно
+STATE_RETRY_DELAY = 1.0
+
+
+@dataclass(order=True)
+class Item:
+    """Элемент очереди запросов с приоритетом."""
+    priority: int
+    item: Any = field(compare=False)
+    # Клиент из заголовка x-client-id, между клиентами очередь делится по весам
+    tenant: str = field(default="", compare=False)
+    # Ключ в очереди (старение и порядок поступления), сохраняется при возврате в очередь
+    queue_key: Optional[tuple] = field(default=None, compare=False)
+
+
+class _Flight:
+    """Запрос в очереди или в полёте, ответ на который ждут несколько клиентов."""
+    __slots__ = ("item", "waiters")
+
+    def __init__(self, item: Item):
+        self.item = item
+        self.waiters: set[asyncio.Future] = set()
+
+
+def _share_response(response: Response) -> Response:
+    """Копия прочитанного целиком ответа для очередного клиента."""
+    copy = Response(content=response.body, status_code=response.status_code)
+    copy.raw_headers = list(response.raw_headers)
+    return copy
+
 
 class API:
-    def __init__(self, config: APIModel, stop_event: asyncio.Event):
+    def __init__(
+        self,
+        config: APIModel,
+        stop_event: asyncio.Event,
+        session_pool: SessionPool,
+        state_backend: StateBackend,
+        response_cache: Optional[ResponseCache] = None,
+        journal: Optional[RequestJournal] = None,
+        clock: Clock = SYSTEM_CLOCK
+    ):
         self.identifier = config.identifier
-        self._interval = config.rate_limit.interval * 1.1
-        self.counter = 0
+        # Время планировщика, квот и метрик; при моделировании - виртуальное
+        self.clock = clock
+        self.rate_limit = config.rate_limit
+        self.state_backend = state_backend
+        self.limiter = RateLimiter(config.rate_limit, state_backend, self.identifier)
+        self.concurrency = ConcurrencyLimiter(config.rate_limit)
         self.rpd = config.rate_limit.RPD
-        self.queue = asyncio.PriorityQueue()
+        self.quota = build_schedule(config.rate_limit)
+        self.max_queue_size = config.rate_limit.max_queue_size
+        self.max_wait = config.rate_limit.max_wait
+        self.queue = build_queue(config.rate_limit, clock)
         self.stop_event = stop_event
-        self.add_random = config.rate_limit.add_random
+        self.session_pool = session_pool
+        self._timeout = aiohttp.ClientTimeout(total=config.rate_limit.timeout)
+        self.daily = None
+        if self.rpd >= 0:
+            self.daily = QuotaCounter(f"{self.identifier}|rpd", self.rpd, self.quota, state_backend, clock)
+        # Квоты клиентов считаются по тому же расписанию, что и RPD идентификатора
+        self.tenant_quotas = {
+            name: QuotaCounter(f"{self.identifier}|rpd|{name}", tenant.RPD, self.quota, state_backend, clock)
+            for name, tenant in config.rate_limit.tenants.items() if tenant.RPD >= 0
+        }
+        self._coalesce_headers = [name.lower() for name in config.rate_limit.coalesce_headers]
+        self._flights: dict[tuple, _Flight] = {}
+        self.cache = response_cache if config.rate_limit.cache else None
+        self.metrics = APIMetrics()
+        self.journal = journal if config.rate_limit.durable else None
+        if config.rate_limit.durable and journal is None:
+            # Журнал создаётся при запуске, только если в apis.json есть долговечные API
+            logger.warning(f"API {self.identifier}: журнал запросов не создан, очередь не переживёт перезапуск")
+        # Сильные ссылки на запросы в полёте: event loop держит на задачи только слабые
+        self._in_flight: set[asyncio.Task] = set()
+
+    async def reserve_daily(self, tenant: str = "") -> bool:
+        """
+        Учитывает запрос в RPD идентификатора и в квоте клиента.
+
+        Args:
+            tenant: Клиент из заголовка x-client-id
+
+        Returns:
+            False, если лимит идентификатора или квота клиента на период исчерпаны
+        """
+        if self.daily is not None and not await self.daily.reserve():
+            return False
+        tenant_quota = self.tenant_quotas.get(tenant)
+        if tenant_quota is not None and not await tenant_quota.reserve():
+            if self.daily is not None:
+                self.daily.refund()
+            return False
+        return True
+
+    def refund_daily(self, tenant: str = "") -> None:
+        """Возвращает единицы RPD и квоты клиента запроса, который так и не был отправлен во внешний API."""
+        if self.daily is not None:
+            self.daily.refund()
+        tenant_quota = self.tenant_quotas.get(tenant)
+        if tenant_quota is not None:
+            tenant_quota.refund()
+
+    def _request_key(self, req: ProxyRequest) -> Optional[tuple]:
+        """Ключ одинаковых GET и HEAD без тела: метод, URL, параметры и значения заголовков из coalesce_headers."""
+        if req.method not in ("GET", "HEAD") or req.data is not None:
+            return None
+        headers = tuple(req.headers.get(name, "") for name in self._coalesce_headers)
+        return req.method, req.url, tuple(sorted(req.params)), headers
+
+    def flight_key(self, req: ProxyRequest) -> Optional[tuple]:
+        """Возвращает ключ совмещения одинаковых запросов или None, если запрос не совмещается."""
+        return self._request_key(req) if self.rate_limit.coalesce else None
+
+    def cached_response(self, req: ProxyRequest, now: float) -> Optional[Response]:
+        """
+        Ищет ответ на запрос в кэше.
+
+        Свежий ответ возвращается сразу. Для устаревшего ответа с ETag или Last-Modified
+        запрос становится условным: если ответ не изменился, внешний API вернёт 304 без тела.
+        Условные запросы клиента и запросы с Cache-Control: no-cache/no-store кэш не использует.
+
+        Args:
+            req: Запрос к внешнему API, для кэшируемого запроса заполняются cache_key и cached
+            now: Текущее время, unix timestamp
+
+        Returns:
+            Ответ из кэша или None, если запрос нужно отправить во внешний API
+        """
+        if self.cache is None or req.method != "GET":
+            return None
+        key = self._request_key(req)
+        if key is None or "if-none-match" in req.headers or "if-modified-since" in req.headers:
+            return None
+        directives = parse_cache_control(req.headers.get("cache-control"))
+        if "no-cache" in directives or "no-store" in directives:
+            return None
+
+        key = (self.identifier, *key)
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh(now):
+            self.cache.hits += 1
+            return entry.to_response(now)
+        self.cache.misses += 1
+        req.cache_key = key
+        req.shared = True
+        if entry is not None and entry.revalidatable:
+            req.cached = entry
+            req.headers.update(entry.conditional_headers())
+        return None
+
+    def _cache_response(self, item: Item, response: Response) -> Response:
+        """
+        Сохраняет ответ внешнего API в кэш.
+
+        Ответ 304 на условный запрос обновляет устаревшую запись, клиент получает сохранённый ответ,
+        а единица RPD возвращается: тело не передавалось, и запрос не считается полноценным.
+        """
+        req = item.item[1]
+        now = self.clock.time()
+        ttl = self.rate_limit.cache_ttl
+        if response.status_code == 304 and req.cached is not None:
+            entry = self.cache.refresh(req.cache_key, req.cached, response, now, ttl)
+            if self.rate_limit.cache_free_revalidation:
+                self.refund_daily(item.tenant)
+            return entry.to_response(now)
+        self.cache.store(req.cache_key, response, now, ttl, self._coalesce_headers)
+        return response
+
+    def _add_waiter(self, flight: _Flight) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        flight.waiters.add(waiter)
+        return waiter
+
+    def join_flight(self, key: tuple, deadline: Optional[float]) -> Optional[tuple[asyncio.Future, ProxyRequest]]:
+        """
+        Присоединяется к такому же запросу, уже ждущему в очереди или в полёте.
+
+        Срок общего запроса продлевается до срока присоединившегося клиента: истечение срока первого клиента
+        не должно оставить без ответа остальных.
+
+        Args:
+            key: Ключ совмещения запроса
+            deadline: Срок присоединяющегося клиента (unix timestamp) или None
+
+        Returns:
+            Future с копией ответа и общий запрос или None, если такого запроса нет
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        req = flight.item.item[1]
+        if req.deadline is not None:
+            req.deadline = None if deadline is None else max(req.deadline, deadline)
+        return self._add_waiter(flight), req
+
+    def start_flight(self, key: tuple, item: Item) -> asyncio.Future:
+        """
+        Делает запрос общим для одинаковых запросов, которые придут, пока он не выполнен.
+
+        Returns:
+            Future с копией ответа для первого клиента
+        """
+        fut, req = item.item
+        req.shared = True
+        flight = self._flights[key] = _Flight(item)
+        fut.add_done_callback(lambda f: self._land(key, flight))
+        return self._add_waiter(flight)
+
+    def leave_flight(self, key: tuple, waiter: asyncio.Future) -> None:
+        """
+        Отсоединяет клиента от общего запроса.
+
+        Если клиентов не осталось, а запрос ещё не отправлен, он снимается с очереди и его единица RPD возвращается.
+        """
+        flight = self._flights.get(key)
+        if flight is None or waiter not in flight.waiters:
+            return
+        flight.waiters.discard(waiter)
+        fut, req = flight.item.item
+        if not flight.waiters and not req.sent and not fut.done():
+            fut.cancel()
+            self.refund_daily(flight.item.tenant)
+
+    def _land(self, key: tuple, flight: _Flight) -> None:
+        """Раздаёт результат общего запроса всем ожидающим клиентам."""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        fut = flight.item.item[0]
+        for waiter in flight.waiters:
+            if waiter.done():
+                continue
+            if fut.cancelled():
+                waiter.cancel()
+            elif fut.exception() is not None:
+                waiter.set_exception(fut.exception())
+            else:
+                waiter.set_result(_share_response(fut.result()))
 
-    @property
-    def interval(self):
-        return self._interval + (random() if self.add_random else 0)
+    def request_deadline(self, requested: Optional[float], now: float) -> Optional[float]:
+        """
+        Возвращает срок запроса с учётом max_wait.
+
+        Args:
+            requested: Срок, переданный клиентом (unix timestamp), или None
+            now: Текущее время, unix timestamp
+        """
+        if self.max_wait < 0:
+            return requested
+        return min(requested if requested is not None else math.inf, now + self.max_wait)
+
+    def expected_wait(self) -> float:
+        """Оценка ожидания нового запроса в очереди: глубина очереди × средний промежуток между запросами."""
+        return (self.queue.qsize() + 1) * self.limiter.gap
+
+    def admit(self, deadline: Optional[float], now: float) -> Optional[float]:
+        """
+        Проверяет, можно ли ставить запрос в очередь.
+
+        Args:
+            deadline: Срок запроса (unix timestamp) или None
+            now: Текущее время, unix timestamp
+
+        Returns:
+            None, если запрос принят, иначе через сколько секунд очередь сможет его принять
+        """
+        depth = self.queue.qsize()
+        if 0 < self.max_queue_size <= depth:
+            return (depth - self.max_queue_size + 1) * self.limiter.gap
+        if deadline is not None:
+            overdue = self.expected_wait() - (deadline - now)
+            if overdue > 0:
+                return overdue
+        return None
+
+    def journal_item(self, item: Item, detached: bool = False) -> Optional[int]:
+        """
+        Записывает запрос долговечного идентификатора в журнал: если процесс остановится раньше,
+        чем запрос будет выполнен, после перезапуска он снова встанет в очередь.
+
+        Запросы с потоковым телом не записываются: тело нельзя прочитать второй раз.
+
+        Args:
+            item: Элемент очереди
+            detached: Клиент не ждёт ответа (x-async), ответ внешнего API только записывается в лог
+
+        Returns:
+            Номер записи в журнале или None, если запрос не записан
+        """
+        fut, req = item.item
+        if self.journal is None or not req.replayable:
+            return None
+        record_id = self.journal.append({
+            "api": self.identifier,
+            "method": req.method,
+            "url": req.url,
+            "headers": req.headers,
+            "params": req.params,
+            "body": encode_body(req.data),
+            "priority": item.priority,
+            "tenant": item.tenant,
+            "deadline": req.deadline,
+        })
+        self._track_journaled(record_id, fut, detached)
+        return record_id
+
+    def _track_journaled(self, record_id: int, fut: asyncio.Future, detached: bool) -> None:
+        """Отмечает запрос в журнале завершённым, когда его future завершится (ответ, срок, отказ клиента)."""
+
+        def done(f: asyncio.Future):
+            self.journal.complete(record_id)
+            if detached and not f.cancelled() and f.exception() is None:
+                response = f.result()
+                logger.info("Запрос %s из журнала %s выполнен: %s", record_id, self.identifier, response.status_code)
+                discard_response(response)
+
+        fut.add_done_callback(done)
+
+    async def replay(self, record: dict) -> None:
+        """
+        Ставит в очередь незавершённый запрос из журнала. Ответ на него никто не ждёт.
+
+        Запрос снова учитывается в RPD: единица, взятая до перезапуска, могла не дойти до хранилища.
+        """
+        req = ProxyRequest(
+            record["url"], record["method"], record["headers"], [tuple(p) for p in record["params"]],
+            decode_body(record["body"]), record["deadline"], self.clock.monotonic()
+        )
+        if not await self.reserve_daily(record["tenant"]):
+            logger.warning(f"Запрос {record['id']} из журнала {self.identifier} отброшен: лимит RPD исчерпан")
+            self.journal.complete(record["id"])
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._track_journaled(record["id"], fut, True)
+        self.queue.put_nowait(Item(record["priority"], (fut, req), record["tenant"]))
+
+    async def release_leases(self) -> None:
+        """Возвращает в хранилище невостребованные единицы RPD, чтобы их могли потратить другие экземпляры."""
+        for counter in [self.daily, *self.tenant_quotas.values()]:
+            if counter is not None:
+                await counter.release()
 
     async def worker(self):
         logger.info(f"Worker created for {self.identifier}")
-        tasks = {}
 
-        while not self.stop_event.is_set():
-            for fut, task in list(tasks.items()):
-                if task.done():
-                    tasks.pop(fut)
-                    fut.set_result(await task)
-                    self.queue.task_done()
+        try:
+            while not self.stop_event.is_set():
+                # Сначала ждём свободного места среди запросов в полёте и слота, который разрешат все правила,
+                # и только потом берём задачу из очереди,
+                # чтобы за время ожидания в очередь успели попасть более приоритетные запросы
+                await self.concurrency.wait()
+                try:
+                    delay = await self.limiter.delay(self.clock.time())
+                except Exception as e:
+                    logger.error(f"Worker {self.identifier}: хранилище состояния недоступно: {repr(e)}")
+                    await asyncio.sleep(STATE_RETRY_DELAY)
+                    continue
+                if delay > 0:
+                    await asyncio.sleep(delay)
 
-            if not self.queue.empty():
-                item = await self.queue.get()
+                # Пустая очередь не крутит цикл: worker спит, пока не придёт запрос
+                item = await self._next_item()
+                if item is None:
+                    continue
                 pr, (fut, req) = item.priority, item.item
-                logger.info(
-                    f"Worker {self.identifier} found task with priority {pr}: {req.get('method')}, {req.get('url')}")
-                task = asyncio.create_task(make_request(req))
-                tasks[fut] = task
-                await asyncio.sleep(self.interval)
-            else:
-                await asyncio.sleep(0)
 
-        logger.info(f"Worker {self.identifier} завершён")
+                # С общим хранилищем ближайший слот мог занять другой процесс, тогда ждём следующий
+                try:
+                    send_at = await self.limiter.acquire(self.clock.time(), self.queue.qsize() + 1)
+                except Exception as e:
+                    logger.error(f"Worker {self.identifier}: хранилище состояния недоступно: {repr(e)}")
+                    # Запрос возвращается в очередь и будет отправлен, когда хранилище ответит
+                    self.queue.task_done()
+                    self.queue.requeue(item)
+                    await asyncio.sleep(STATE_RETRY_DELAY)
+                    continue
+                if req.expired(send_at):
+                    # Слот уже занят, но внешний API запрос не получит: клиенту ответ после срока не нужен
+                    self._discard(item)
+                    continue
+                delay = send_at - self.clock.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    if fut.done():
+                        # Клиент ушёл, пока worker ждал слот: слот потерян, но RPD не тратится
+                        self._discard(item)
+                        continue
+
+                # Сообщения на каждый запрос форматируются лениво: при выключенном уровне или отброшенные
+                # ограничением частоты они ничего не стоят
+                logger.info("Worker %s found task with priority %s: %s, %s", self.identifier, pr, req.method, req.url)
+                req.sent = True
+                sent_at = self.clock.monotonic()
+                self.metrics.sent += 1
+                self.metrics.queue_wait.observe(sent_at - req.queued_at)
+                session = self.session_pool.get(req.url, self.rate_limit)
+                stream = self.rate_limit.stream_response and not req.shared
+                task = asyncio.create_task(make_request(session, req, self._timeout, stream))
+                self._in_flight.add(task)
+                self.concurrency.acquire()
+                task.add_done_callback(lambda t, i=item, sent_at=sent_at: self._on_done(t, i, sent_at))
+        finally:
+            logger.info(f"Worker {self.identifier} завершён")
+
+    async def _next_item(self) -> Optional[Item]:
+        """
+        Берёт из очереди следующий запрос, который ещё нужно отправить.
+
+        Запросы с истёкшим сроком и запросы, от которых отказался клиент, отбрасываются без ожидания слота.
+
+        Returns:
+            Элемент очереди или None, если все запросы в очереди оказались отброшены
+        """
+        item = await self.queue.get()
+        while item.item[0].done() or item.item[1].expired(self.clock.time()):
+            self._discard(item)
+            if self.queue.empty():
+                return None
+            item = self.queue.get_nowait()
+        return item
+
+    def _discard(self, item: Item) -> None:
+        """
+        Снимает запрос с очереди без отправки.
+
+        Если клиент уже отказался от запроса, единицу RPD вернул обработчик, иначе она возвращается здесь.
+        """
+        fut, req = item.item
+        self.queue.task_done()
+        if not fut.done():
+            self.refund_daily(item.tenant)
+            self.metrics.rejected["expired"] += 1
+            logger.info("Worker %s: срок запроса истёк до отправки: %s, %s", self.identifier, req.method, req.url)
+            fut.set_result(JSONResponse(status_code=504, content={"msg": "Срок запроса истёк до отправки"}))
+
+    def _on_done(self, task: asyncio.Task, item: Item, sent_at: float):
+        """Отдаёт результат ожидающему обработчику сразу по завершении запроса к внешнему API."""
+        fut, req = item.item
+        self._in_flight.discard(task)
+        self.queue.task_done()
+
+        response = None if task.cancelled() or task.exception() is not None else task.result()
+        throttled = response is not None and response.status_code == 429
+        failed = response is None or response.status_code >= 500 or throttled
+        latency = self.clock.monotonic() - sent_at
+        body = getattr(response, "body_iterator", None)
+        if body is not None:
+            # Потоковое тело ещё держит соединение с внешним API: место в полёте освободится, когда его дочитают
+            response.body_iterator = SlotReleasingBody(body, lambda: self.concurrency.release(latency, failed))
+        else:
+            # Непотоковый ответ к этому моменту уже прочитан целиком
+            self.concurrency.release(latency, failed)
+        self.metrics.upstream_latency.observe(latency)
+        if throttled:
+            self.metrics.throttled += 1
+        elif failed:
+            self.metrics.errors += 1
+
+        if response is not None and self.limiter.feedback_rule is not None:
+            # Обратная связь меняет состояние лимитов в хранилище, поэтому разбирается отдельной задачей
+            followup = asyncio.create_task(self._apply_feedback(item, response))
+            self._in_flight.add(followup)
+            followup.add_done_callback(self._in_flight.discard)
+            return
+
+        if response is not None:
+            self._resolve(item, response)
+        elif fut.done():
+            return
+        elif task.cancelled():
+            fut.cancel()
+        else:
+            fut.set_exception(task.exception())
+
+    def _resolve(self, item: Item, response: Response) -> None:
+        """Сохраняет ответ в кэш и отдаёт его ожидающему обработчику."""
+        fut, req = item.item
+        if req.cache_key is not None:
+            response = self._cache_response(item, response)
+        # Вызывающая сторона могла уже уйти или не дождаться срока и отменить future
+        if fut.done():
+            discard_response(response)
+        else:
+            fut.set_result(response)
+
+    async def _apply_feedback(self, item: Item, response):
+        """
+        Передаёт лимитеру сведения о лимите из ответа внешнего API.
+
+        Запрос, получивший 429, возвращается в очередь с тем же приоритетом,
+        остальные ответы отдаются вызывающей стороне.
+        Если сведения учесть не удалось (например, хранилище состояния недоступно), ответ отдаётся как есть:
+        иначе обработчик ждал бы его вечно.
+        """
+        fut, req = item.item
+        try:
+            now = self.clock.time()
+            throttled = response.status_code == 429
+            feedback = parse_rate_limit_headers(response.headers, now)
+            await self.limiter.apply_feedback(feedback, now, throttled, req.attempts)
+            req.attempts += 1
+            retry = throttled and req.replayable and req.attempts <= self.rate_limit.max_retries
+        except Exception as e:
+            logger.error(f"Worker {self.identifier}: не удалось учесть лимит из ответа внешнего API: {repr(e)}")
+            retry = False
+
+        if retry:
+            logger.info(
+                "Worker %s: 429 от внешнего API, попытка %s, запрос возвращён в очередь", self.identifier, req.attempts
+            )
+            self.queue.requeue(item)
+        else:
+            self._resolve(item, response)
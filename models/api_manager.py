@@ -3,18 +3,22 @@
 
 Отвечает за:
 - Инициализацию и управление жизненным циклом API-инстансов
-- Запуск фоновых задач (workers, daily counter reset)
+- Запуск фоновых задач (workers)
 - Предоставление доступа к API по идентификаторам
 """
 import asyncio
-from datetime import datetime, timedelta
 from typing import Optional
 
 from models.api import API
+from services.clock import SYSTEM_CLOCK, Clock
 from services.identifier_matcher import IdentifierMatcher
+from services.request_journal import RequestJournal
+from services.response_cache import ResponseCache
+from services.session_pool import SessionPool
+from services.state_backends import StateBackend
 
 from logger import setup_logger
-from schemas import APIModel
+from schemas import APIModel, SettingsModel
 
 logger = setup_logger(__name__)
 
@@ -23,21 +27,45 @@ class APIManager:
     """
     Менеджер всех API-инстансов и фоновых задач.
     
-    Управляет жизненным циклом API-инстансов, запускает workers для обработки запросов
-    и выполняет периодические задачи (например, сброс счётчиков в полночь).
+    Управляет жизненным циклом API-инстансов и запускает workers для обработки запросов.
+    Состояние лимитов и счётчики RPD всех API хранятся в общем хранилище, выбранном в настройках;
+    счётчики RPD сбрасываются по расписанию каждого API при первом обращении в новом периоде.
     """
 
-    def __init__(self, configs: list[dict], stop_event: asyncio.Event):
+    def __init__(
+        self,
+        configs: list[dict],
+        stop_event: asyncio.Event,
+        session_pool: SessionPool,
+        state_backend: StateBackend,
+        settings: SettingsModel,
+        journal: Optional[RequestJournal] = None,
+        clock: Clock = SYSTEM_CLOCK
+    ):
         """
         Инициализация менеджера API.
         
         Args:
             configs: Список конфигураций API
             stop_event: Событие для остановки всех фоновых задач
+            session_pool: Пул HTTP-сессий к внешним API
+            state_backend: Хранилище состояния лимитов и счётчиков RPD
+            settings: Общие настройки лимитера
+            journal: Журнал запросов долговечных (durable) API
+            clock: Часы планировщика и квот всех API (виртуальные при моделировании)
         """
         self._apis: dict[str, API] = {}
         self._stop_event = stop_event
-        self._identifier_matcher = IdentifierMatcher(self)
+        self._session_pool = session_pool
+        self._state_backend = state_backend
+        self._journal = journal
+        self._clock = clock
+        self._tasks: list[asyncio.Task] = []
+        self._identifier_matcher = IdentifierMatcher(self, settings.resolution_cache_size)
+        # Кэш ответов общий для всех API, ключ включает идентификатор
+        self._response_cache = ResponseCache(
+            settings.cache_max_bytes, settings.cache_disk_path, settings.cache_disk_size
+        )
         
         self._initialize_apis(configs)
         logger.info(f"Инициализировано {len(self._apis)} API")
@@ -58,7 +86,11 @@ class APIManager:
                 if self._identifier_matcher.has_conflict(cfg_model.identifier):
                     continue
                 
-                self._apis[cfg_model.identifier] = API(cfg_model, self._stop_event)
+                self._apis[cfg_model.identifier] = API(
+                    cfg_model, self._stop_event, self._session_pool, self._state_backend,
+                    self._response_cache, self._journal, self._clock
+                )
+                self._identifier_matcher.register(cfg_model.identifier)
                 
             except (ValueError, KeyError, TypeError) as e:
                 logger.error(f"Ошибка валидации конфигурации API: {repr(e)}")
@@ -66,47 +98,59 @@ class APIManager:
                 logger.error(f"Неожиданная ошибка при инициализации API: {repr(e)}")
 
     def start(self) -> None:
-        """
-        Запускает все фоновые задачи:
-        - Задачи для сброса счётчиков в полночь
-        - Workers для каждого API-инстанса
-        """
+        """Запускает workers для каждого API-инстанса."""
         if not self._apis:
             logger.info("APIManager: нет инициализированных API")
             return
 
-        asyncio.create_task(self._midnight_updater())
         for api in self._apis.values():
-            asyncio.create_task(api.worker())
+            self._tasks.append(asyncio.create_task(api.worker()))
 
-    async def _midnight_updater(self) -> None:
-        """
-        Фоновая задача, сбрасывающая счётчики запросов всех API в полночь.
-        
-        Работает в бесконечном цикле до установки stop_event.
+    def replay(self, records: list[dict]) -> None:
         """
-        if self._stop_event is None:
-            logger.warning("APIManager: stop_event не установлен, обновление счётчиков отменено")
-            return
+        Ставит в очереди незавершённые запросы из журнала (в фоне: учёт RPD обращается к хранилищу).
 
-        while not self._stop_event.is_set():
-            now = datetime.now()
-            # Вычисляем время следующей полночи
-            target = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-            sleep_seconds = (target - now).total_seconds()
-            
-            await asyncio.sleep(sleep_seconds)
-            
-            # Сбрасываем счётчики всех API
-            self._reset_all_counters()
-            
-            logger.info("✅ Обновил счётчики запросов в день")
-            await asyncio.sleep(1)  # Небольшая задержка перед следующим циклом
+        Args:
+            records: Записи журнала в порядке поступления
+        """
+        if records:
+            self._tasks.append(asyncio.create_task(self._replay(records)))
+
+    async def _replay(self, records: list[dict]) -> None:
+        for record in records:
+            api = self._apis.get(record["api"])
+            if api is None or api.journal is None:
+                logger.warning(f"Запрос {record['id']} из журнала пропущен: нет долговечного API {record['api']}")
+                self._journal.complete(record["id"])
+                continue
+            try:
+                await api.replay(record)
+            except Exception as e:
+                # Запрос остаётся в журнале и будет поставлен в очередь при следующем запуске
+                logger.error(f"Не удалось восстановить запрос {record['id']} из журнала: {repr(e)}")
+
+    async def stop(self) -> None:
+        """
+        Останавливает все фоновые задачи.
 
-    def _reset_all_counters(self) -> None:
-        """Сбрасывает счётчики запросов для всех API-инстансов."""
+        Workers спят на пустой очереди и не проверяют stop_event, пока не придёт запрос,
+        поэтому после установки события задачи отменяются явно.
+        """
+        self._stop_event.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
         for api in self._apis.values():
-            api.counter = 0
+            try:
+                await api.release_leases()
+            except Exception as e:
+                logger.error(f"Не удалось вернуть разрешения {api.identifier}: {repr(e)}")
+        await self._state_backend.close()
+        self._response_cache.close()
+        if self._journal is not None:
+            # Запросы, оставшиеся в очередях, остаются в журнале и будут отправлены после запуска
+            self._journal.close()
 
     def get(self, identifier_key: str) -> Optional[API]:
         """
@@ -148,9 +192,22 @@ class APIManager:
         if identifier in self._apis:
             raise Exception(f'API с таким идентификатором уже существует: {identifier}')
         
-        api = API(cfg, self._stop_event)
+        api = API(
+            cfg, self._stop_event, self._session_pool, self._state_backend,
+            self._response_cache, self._journal, self._clock
+        )
         self._apis[identifier] = api
-        asyncio.create_task(api.worker())
+        self._identifier_matcher.register(identifier)
+        self._tasks.append(asyncio.create_task(api.worker()))
+
+    def get_response_cache(self) -> ResponseCache:
+        """
+        Возвращает общий кэш ответов внешних API.
+
+        Returns:
+            ResponseCache всех API
+        """
+        return self._response_cache
 
     def get_identifier_matcher(self) -> IdentifierMatcher:
         """
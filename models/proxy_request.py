@@ -0,0 +1,55 @@
+from typing import Any, Optional
+
+
+class ProxyRequest:
+    """
+    Запрос к внешнему API, собранный напрямую из входящего запроса.
+
+    Отдельной валидации нет: URL уже проверен при поиске идентификатора
+    (origin и путь совпали с провалидированным идентификатором), а метод ограничен роутом.
+    """
+
+    __slots__ = (
+        "url", "method", "headers", "params", "data", "attempts",
+        "deadline", "sent", "shared", "cache_key", "cached", "queued_at",
+    )
+
+    def __init__(
+        self,
+        url: str,
+        method: str,
+        headers: dict,
+        params: list,
+        data: Optional[Any],
+        deadline: Optional[float],
+        queued_at: float
+    ):
+        self.url = url
+        self.method = method
+        self.headers = headers
+        self.params = params
+        self.data = data
+        # Момент (unix timestamp), после которого запрос уже не нужен клиенту и не отправляется
+        self.deadline = deadline
+        # Сколько раз запрос уже отправлялся во внешний API
+        self.attempts = 0
+        # Запрос передан во внешний API хотя бы раз, его единица RPD потрачена
+        self.sent = False
+        # Ответ получат несколько клиентов (совмещённые одинаковые запросы или кэш), поэтому он читается целиком
+        self.shared = False
+        # Ключ в кэше ответов, если ответ на запрос кэшируется
+        self.cache_key = None
+        # Устаревшая запись кэша, которую проверяет этот запрос (условный запрос с If-None-Match)
+        self.cached = None
+        # Момент поступления запроса (монотонное время часов API), для метрики времени ожидания в очереди.
+        # Обязателен: значение по умолчанию от системных часов смешало бы их с виртуальными при моделировании
+        self.queued_at = queued_at
+
+    @property
+    def replayable(self) -> bool:
+        """Можно ли отправить запрос повторно: поток тела читается только один раз."""
+        return self.data is None or isinstance(self.data, bytes)
+
+    def expired(self, at: float) -> bool:
+        """Истёк ли срок запроса к моменту at."""
+        return self.deadline is not None and at > self.deadline
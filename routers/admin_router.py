@@ -2,10 +2,11 @@
 Административный роутер для управления API.
 """
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from logger import setup_logger
 from schemas import APIModel
+from services.metrics import render_metrics
 
 logger = setup_logger(__name__)
 
@@ -60,3 +61,56 @@ async def get_apis(request: Request):
         content=list(api_manager.get_all_apis().keys())
     )
 
+
+@router.get('/resolution_cache')
+async def get_resolution_cache(request: Request):
+    """
+    Возвращает статистику кэша поиска идентификаторов по URL.
+    
+    Args:
+        request: FastAPI Request объект
+        
+    Returns:
+        JSONResponse с количеством попаданий, промахов и размером кэша
+    """
+    api_manager = request.app.state.api_manager
+    return JSONResponse(
+        status_code=200,
+        content=api_manager.get_identifier_matcher().cache_info()
+    )
+
+
+@router.get('/response_cache')
+async def get_response_cache(request: Request):
+    """
+    Возвращает статистику кэша ответов внешних API.
+    
+    Args:
+        request: FastAPI Request объект
+        
+    Returns:
+        JSONResponse с количеством попаданий, промахов, проверенных записей и размером кэша
+    """
+    api_manager = request.app.state.api_manager
+    return JSONResponse(
+        status_code=200,
+        content=api_manager.get_response_cache().info()
+    )
+
+
+@router.get('/metrics')
+async def get_metrics(request: Request):
+    """
+    Возвращает метрики лимитера в текстовом формате Prometheus.
+    
+    Args:
+        request: FastAPI Request объект
+        
+    Returns:
+        PlainTextResponse с метриками всех API
+    """
+    api_manager = request.app.state.api_manager
+    return PlainTextResponse(
+        await render_metrics(api_manager),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
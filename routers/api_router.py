@@ -2,25 +2,205 @@
 Роутер для обработки API запросов.
 """
 import asyncio
-from dataclasses import dataclass, field
-from typing import Any
+import base64
+import json
 
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 
 from logger import setup_logger
-from schemas import RequestIdentifierModel, HTTP_METHODS_LIST
+from schemas import HTTP_METHODS_LIST
+from services.request_submission import resolve_api, submit_request
+from services.requester import filter_headers
 
 logger = setup_logger(__name__)
 
 router = APIRouter(tags=['Rate Limiter'])
 
+# Тела не больше этого размера читаются сразу, более крупные передаются во внешний API потоком
+BUFFERED_BODY_LIMIT = 64 * 1024
 
-@dataclass(order=True)
-class Item:
-    """Элемент очереди запросов с приоритетом."""
-    priority: int
-    item: Any = field(compare=False)
+# Заголовки пакета, которые действуют на все его запросы, если у запроса нет своих
+BATCH_DEFAULT_HEADERS = ('x-priority', 'x-client-id', 'x-deadline', 'x-identifier-extra')
+
+NDJSON_MEDIA_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-seq')
+
+
+def _has_body(headers) -> bool:
+    """Проверяет по заголовкам, передал ли клиент тело запроса."""
+    return headers.get('content-length', '0') != '0' or 'transfer-encoding' in headers
+
+
+def _small_body(headers) -> bool:
+    """Проверяет, что тело известной длины и его можно прочитать целиком заранее."""
+    length = headers.get('content-length', '')
+    return length.isdigit() and int(length) <= BUFFERED_BODY_LIMIT
+
+
+class _BatchResponse(StreamingResponse):
+    """
+    Потоковый ответ пакета, который не слушает канал ASGI.
+
+    Тело NDJSON читается, пока результаты уже отправляются, а слушатель отключения StreamingResponse
+    забрал бы его части. Уход клиента замечает чтение тела, а после него - неудачная отправка результата.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+async def _response_body(response: Response) -> bytes:
+    """Читает тело ответа, в том числе потокового, целиком."""
+    iterator = getattr(response, "body_iterator", None)
+    if iterator is None:
+        return response.body
+    return b"".join([chunk if isinstance(chunk, bytes) else chunk.encode() async for chunk in iterator])
+
+
+async def _batch_result(key, response: Response) -> bytes:
+    """Строка NDJSON с результатом запроса пакета. Тело, которое не является текстом UTF-8, передаётся в base64."""
+    body = await _response_body(response)
+    result = {"id": key, "status": response.status_code, "headers": dict(response.headers)}
+    try:
+        result["body"] = body.decode()
+    except UnicodeDecodeError:
+        result["body_base64"] = base64.b64encode(body).decode()
+    return json.dumps(result, ensure_ascii=False).encode() + b"\n"
+
+
+async def _submit_spec(api_manager, spec, defaults: dict) -> Response:
+    """
+    Проводит один запрос пакета по тем же правилам, что и отдельный запрос.
+
+    Args:
+        api_manager: Менеджер API
+        spec: Описание запроса: url, method, headers, params, body (строка) или json
+        defaults: Заголовки лимитера из заголовков пакета
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get("url"), str):
+        return JSONResponse(status_code=400, content={"msg": "Запрос пакета должен быть объектом с полем url"})
+    method = str(spec.get("method", "GET")).upper()
+    if method not in HTTP_METHODS_LIST:
+        return JSONResponse(status_code=400, content={"msg": f"Неподдерживаемый метод {method}"})
+
+    headers = {**defaults, **filter_headers({str(k).lower(): str(v) for k, v in spec.get("headers", {}).items()})}
+    url = spec["url"]
+    api = resolve_api(api_manager, url, method, headers)
+    if api is None:
+        return JSONResponse(status_code=400, content={"msg": "Нет апи с таким идентификатором"})
+
+    params = spec.get("params", [])
+    params = [(str(k), str(v)) for k, v in (params.items() if isinstance(params, dict) else params)]
+    data = None
+    if "json" in spec:
+        data = json.dumps(spec["json"]).encode()
+        headers.setdefault('content-type', 'application/json')
+    elif spec.get("body") is not None:
+        data = str(spec["body"]).encode()
+    return await submit_request(api, url, method, headers, params, data)
+
+
+@router.post("/batch")
+async def handle_batch(request: Request):
+    """
+    Принимает пакет запросов одним вызовом: JSON-массив или NDJSON-поток (по строке на запрос).
+
+    Каждый запрос направляется в очередь своего API так же, как отдельный запрос, поэтому темп отправки
+    задают лимиты каждого идентификатора. Запросы NDJSON-потока ставятся в очередь по мере чтения.
+    Заголовки x-priority, x-client-id, x-deadline и x-identifier-extra пакета действуют на все его запросы,
+    если запрос не задаёт свои.
+
+    Args:
+        request: FastAPI Request объект
+
+    Returns:
+        NDJSON-поток результатов в порядке их готовности:
+        {"id": id запроса или его номер, "status": ..., "headers": {...}, "body": ... или "body_base64": ...}
+    """
+    api_manager = request.app.state.api_manager
+    defaults = {k: v for k, v in request.headers.items() if k in BATCH_DEFAULT_HEADERS}
+    ndjson = request.headers.get('content-type', '').split(';')[0].strip() in NDJSON_MEDIA_TYPES
+
+    specs = None
+    if not ndjson:
+        try:
+            specs = json.loads(await request.body())
+        except ValueError:
+            specs = None
+        if not isinstance(specs, list):
+            return JSONResponse(status_code=400, content={"msg": "Тело должно быть JSON-массивом запросов или NDJSON"})
+
+    results: asyncio.Queue = asyncio.Queue()
+    tasks: set[asyncio.Task] = set()
+
+    async def run(key, spec):
+        try:
+            response = await _submit_spec(api_manager, spec, defaults)
+        except Exception as e:
+            logger.error(f"Ошибка запроса пакета {key}: {repr(e)}")
+            response = JSONResponse(status_code=500, content={"msg": repr(e)})
+        results.put_nowait(await _batch_result(key, response))
+
+    def spawn(index, spec):
+        key = spec.get("id", index) if isinstance(spec, dict) else index
+        task = asyncio.create_task(run(key, spec))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def lines():
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                yield line
+        yield buffer
+
+    async def watch():
+        # Тело прочитано: дальше канал ASGI слушается только ради ухода клиента
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+        logger.info("Клиент закрыл соединение, запросы пакета отменены")
+        results.put_nowait(None)
+
+    async def feed():
+        try:
+            if specs is not None:
+                for index, spec in enumerate(specs):
+                    spawn(index, spec)
+            else:
+                index = 0
+                async for line in lines():
+                    if not line.strip():
+                        continue
+                    try:
+                        spec = json.loads(line)
+                    except ValueError:
+                        spec = None
+                    spawn(index, spec)
+                    index += 1
+        except ClientDisconnect:
+            logger.info("Клиент закрыл соединение, запросы пакета отменены")
+            results.put_nowait(None)
+            return
+        pending = list(tasks)
+        tasks.add(asyncio.create_task(watch()))
+        await asyncio.gather(*pending)
+        results.put_nowait(None)
+
+    async def stream():
+        feeder = asyncio.create_task(feed())
+        try:
+            while (line := await results.get()) is not None:
+                yield line
+        finally:
+            # Запросы, ещё не отправленные во внешний API, снимаются с очередей, их RPD возвращается
+            feeder.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    return _BatchResponse(stream(), media_type='application/x-ndjson')
 
 
 @router.api_route("/{url:path}", methods=HTTP_METHODS_LIST)
@@ -28,7 +208,7 @@ async def handle_request(request: Request, url: str):
     """
     Обрабатывает входящие HTTP запросы и направляет их в соответствующий API worker.
     
-    Определяет идентификатор API по URL, методу и extra параметру,
+    Определяет идентификатор API по URL, методу и extra параметру (с кэшированием результата),
     проверяет лимиты, добавляет запрос в очередь обработки.
     
     Args:
@@ -41,50 +221,17 @@ async def handle_request(request: Request, url: str):
     # Получаем api_manager из app state
     api_manager = request.app.state.api_manager
     
-    headers = dict(request.headers)
-    ide_extra = headers.pop('x-identifier-extra', "")
-    identifier_matcher = api_manager.get_identifier_matcher()
-    ide = identifier_matcher.find_identifier(url, request.method, ide_extra, first_match_only=True)
-    
-    # Парсим JSON тело запроса (если есть)
-    json_data = {}
-    try:
-        json_data = await request.json()
-    except:
-        pass
-    
-    # Формируем данные запроса
-    req_data = {
-        "identifier": ide,
-        "request": {
-            "url": url,
-            "method": request.method,
-            "headers": headers,
-            "params": request.query_params,
-            "json": json_data
-        }
-    }
-    
-    # Обрабатываем приоритет из заголовка
-    priority = headers.pop('x-priority', 0)
-    try:
-        priority = int(priority)
-        req_data['priority'] = priority
-    except:
-        logger.warning(f'Priority have to be int-like string, got {priority=}')
-    
-    req = RequestIdentifierModel(**req_data)
-    api = api_manager.get(req.identifier)
+    has_body = _has_body(request.headers)
+    headers = filter_headers(request.headers)
+    api = resolve_api(api_manager, url, request.method, headers)
     
     if api is None:
         return JSONResponse(status_code=400, content={"msg": "Нет апи с таким идентификатором"})
     
-    if api.counter == api.rpd:
-        return JSONResponse(status_code=429, content={"msg": "Достигнут лимит запросов в сутки"})
+    # Тело не разбирается. Небольшое тело читается сразу: такой запрос можно повторить после 429
+    # и отменить при уходе клиента. Крупное worker передаст во внешний API потоком при отправке
+    data = None
+    if has_body:
+        data = await request.body() if _small_body(request.headers) else request.stream()
     
-    api.counter += 1
-    fut = asyncio.Future()
-    item = Item(-priority, (fut, req.request.model_dump()))
-    await api.queue.put(item)
-    return await fut
-
+    return await submit_request(api, url, request.method, headers, request.query_params.multi_items(), data, request)
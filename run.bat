@@ -1,3 +1,3 @@
 START CMD /k uvicorn main:app --reload
 
-START CMD /k uvicorn "tests.limited_api":app --port 8889 --reload
+START CMD /k python -m tests.stub_upstream --port 8889
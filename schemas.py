@@ -1,16 +1,61 @@
 import json
-from typing import Literal, Annotated
+from typing import Literal, Annotated, Optional
+from zoneinfo import ZoneInfo
 
-from pydantic import BaseModel, AnyHttpUrl, PlainSerializer, AfterValidator
+from pydantic import BaseModel, AnyHttpUrl, AfterValidator, PositiveInt, PositiveFloat
 
 HTTP_METHODS_LITERAL = Literal["GET", "HEAD", "POST", "PUT", "DELETE", "CONNECT", "OPTIONS", "TRACE", "PATCH"]
 HTTP_METHODS_LIST = list(HTTP_METHODS_LITERAL.__args__)
 
 
+class LimitRuleModel(BaseModel):
+    type: Literal["token_bucket", "fixed_window", "sliding_window_log", "sliding_window_counter"]
+    limit: PositiveInt
+    period: PositiveFloat
+    burst: Optional[PositiveInt] = None
+
+
+def timezone_validator(v):
+    try:
+        ZoneInfo(v)
+    except Exception:
+        raise ValueError(f"Unknown timezone {v!r}, expected IANA name like 'UTC' or 'Europe/Moscow'")
+    return v
+
+
+class TenantModel(BaseModel):
+    weight: PositiveFloat = 1.0
+    RPD: int = -1
+
+
 class RateLimitModel(BaseModel):
     interval: float = 0.001
     RPD: int = -1
+    rpd_reset: Literal["daily", "monthly", "rolling_24h"] = "daily"
+    rpd_timezone: Optional[Annotated[str, AfterValidator(timezone_validator)]] = None
     add_random: bool = False
+    limits: list[LimitRuleModel] = []
+    connections_limit: int = 100
+    keepalive_timeout: float = 15
+    dns_cache_ttl: int = 10
+    timeout: float = 300
+    stream_response: bool = True
+    max_concurrent: int = -1
+    adaptive_concurrency: bool = False
+    latency_tolerance: float = 2.0
+    feedback: bool = False
+    max_retries: int = 3
+    max_queue_size: int = -1
+    max_wait: float = -1
+    aging_rate: float = 0
+    fair_queuing: bool = False
+    tenants: dict[str, TenantModel] = {}
+    coalesce: bool = False
+    coalesce_headers: list[str] = ["authorization", "cookie", "accept", "accept-encoding", "accept-language"]
+    cache: bool = False
+    cache_ttl: float = 0
+    cache_free_revalidation: bool = True
+    durable: bool = False
 
 
 def identifier_validator(v):
@@ -40,19 +85,19 @@ class APIModel(BaseModel):
     rate_limit: RateLimitModel
 
 
-def url_serializer(val: AnyHttpUrl):
-    return str(val)
-
-
-class RequestModel(BaseModel):
-    url: Annotated[AnyHttpUrl, PlainSerializer(url_serializer)]
-    method: HTTP_METHODS_LITERAL
-    headers: dict = {}
-    params: dict = {}
-    json: dict = {}
-
-
-class RequestIdentifierModel(BaseModel):
-    identifier: IdentifierType
-    request: RequestModel
-    priority: int = 0
+class SettingsModel(BaseModel):
+    resolution_cache_size: int = 4096
+    state_backend: Literal["local", "shared_memory", "redis"] = "local"
+    shared_state_path: str = "ratelimiter.state"
+    shared_state_size: int = 16 * 1024 * 1024
+    redis_url: str = "redis://127.0.0.1:6379/0"
+    redis_prefix: str = "ratelimiter:"
+    lease_size: PositiveInt = 10
+    persist_counters: bool = True
+    counters_path: str = "counters.sqlite3"
+    counters_flush_interval: PositiveFloat = 1.0
+    cache_max_bytes: PositiveInt = 64 * 1024 * 1024
+    cache_disk_path: Optional[str] = None
+    cache_disk_size: PositiveInt = 256 * 1024 * 1024
+    journal_path: str = "journal"
+    journal_segment_size: PositiveInt = 64 * 1024 * 1024
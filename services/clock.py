@@ -0,0 +1,114 @@
+"""
+Часы лимитера - источник текущего времени для планировщика, квот RPD, очередей и метрик:
+- Clock: системные часы, по ним работает сервис
+- VirtualClock: виртуальное время для моделирования. Работает со своим event loop: когда всем задачам
+  остаётся только ждать таймеров, loop не спит, а сразу переводит часы к ближайшему таймеру.
+  asyncio.sleep, wait_for и паузы между запросами проходят мгновенно, а сутки с полуночным сбросом RPD -
+  за время, нужное на обработку самих запросов
+"""
+import asyncio
+import selectors
+import time
+from typing import Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Clock:
+    """Системные часы."""
+
+    def time(self) -> float:
+        """Текущее время, unix timestamp."""
+        return time.time()
+
+    def monotonic(self) -> float:
+        """Монотонное время для измерения промежутков, в секундах."""
+        return time.monotonic()
+
+
+SYSTEM_CLOCK = Clock()
+
+
+class VirtualClock(Clock):
+    """
+    Виртуальные часы: время идёт, только когда event loop из new_event_loop ждёт таймер.
+
+    monotonic() совпадает с loop.time() этого event loop, поэтому asyncio.sleep(delay)
+    и delay, посчитанный по time(), измеряются одними и теми же часами.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        """
+        Args:
+            start: Начальный момент, unix timestamp. По умолчанию - текущее системное время
+        """
+        self._epoch = time.time() if start is None else start
+        self._now = 0.0
+
+    def time(self) -> float:
+        return self._epoch + self._now
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float) -> None:
+        """Переводит часы вперёд на seconds секунд."""
+        if seconds > 0:
+            self._now += seconds
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        """Создаёт event loop, таймеры которого идут по этим часам."""
+        return _VirtualEventLoop(self)
+
+    def run(self, main: Coroutine[object, object, T]) -> T:
+        """
+        Выполняет корутину в event loop этих часов, как asyncio.run.
+
+        Returns:
+            Результат корутины
+        """
+        loop = self.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            return loop.run_until_complete(main)
+        finally:
+            try:
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+
+
+class _VirtualSelector:
+    """Селектор, который вместо ожидания событий переводит виртуальные часы на время ожидания."""
+
+    def __init__(self, clock: VirtualClock):
+        self._clock = clock
+        self._selector = selectors.DefaultSelector()
+
+    def select(self, timeout: Optional[float] = None):
+        # Уже готовые события (например, call_soon_threadsafe из других потоков) забираются без ожидания
+        events = self._selector.select(0)
+        if events:
+            return events
+        if timeout is None:
+            # Таймеров нет: переводить часы не к чему, ждём событий по-настоящему
+            return self._selector.select(None)
+        self._clock.advance(timeout)
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class _VirtualEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock):
+        self._virtual_clock = clock
+        super().__init__(_VirtualSelector(clock))
+
+    def time(self) -> float:
+        return self._virtual_clock.monotonic()
@@ -0,0 +1,106 @@
+"""
+Ограничение количества одновременных запросов к внешнему API:
+- Фиксированный максимум запросов в полёте
+- Адаптивный режим (AIMD): лимит растёт на 1 за каждые limit успешных быстрых ответов
+  и уменьшается в 2 раза (не чаще раза за limit ответов), когда задержка ответа превышает базовую
+  в latency_tolerance раз или запрос упал
+- Место в полёте занимает запрос вместе с потоковым телом ответа: соединение с внешним API свободно,
+  только когда тело прочитано или закрыто
+"""
+import asyncio
+import math
+from typing import AsyncIterator, Callable, Optional
+
+from schemas import RateLimitModel
+
+
+class ConcurrencyLimiter:
+    """Лимит запросов в полёте для одного идентификатора."""
+
+    def __init__(self, rate_limit: RateLimitModel):
+        self.max_limit = rate_limit.max_concurrent if rate_limit.max_concurrent > 0 else math.inf
+        self.adaptive = rate_limit.adaptive_concurrency
+        self.latency_tolerance = rate_limit.latency_tolerance
+        self.limit = min(self.max_limit, 4) if self.adaptive else self.max_limit
+        self.in_flight = 0
+        # Минимальная наблюдавшаяся задержка: оценка времени ответа ненагруженного внешнего API
+        self.base_latency = math.inf
+        self._responses_since_decrease = 0
+        self._freed = asyncio.Event()
+
+    async def wait(self) -> None:
+        """Ждёт, пока количество запросов в полёте не станет меньше лимита."""
+        while self.in_flight >= self.limit:
+            self._freed.clear()
+            await self._freed.wait()
+
+    def acquire(self) -> None:
+        """Учитывает отправленный запрос."""
+        self.in_flight += 1
+
+    def release(self, latency: float, failed: bool = False) -> None:
+        """
+        Учитывает завершённый запрос и в адаптивном режиме пересчитывает лимит.
+
+        Args:
+            latency: Время от отправки запроса до получения ответа, в секундах
+            failed: True, если запрос завершился ошибкой
+        """
+        self.in_flight -= 1
+        if self.adaptive:
+            self._adapt(latency, failed)
+        self._freed.set()
+
+    def _adapt(self, latency: float, failed: bool) -> None:
+        self._responses_since_decrease += 1
+        if not failed:
+            # Базовая задержка медленно растёт, чтобы лимитер подстроился под стабильно замедлившийся API
+            self.base_latency = min(self.base_latency * 1.001, latency)
+
+        if failed or latency > self.base_latency * self.latency_tolerance:
+            # Рост задержки при неизменной нагрузке значит, что запросы копятся в очереди внешнего API.
+            # Ответы на запросы, отправленные до прошлого уменьшения, повторно лимит не режут
+            if self._responses_since_decrease >= self.limit:
+                self.limit = max(1.0, self.limit / 2)
+                self._responses_since_decrease = 0
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class SlotReleasingBody:
+    """
+    Потоковое тело ответа, которое освобождает место в полёте, когда прочитано до конца или закрыто.
+
+    Класс, а не асинхронный генератор: aclose генератора, который ещё не начали читать,
+    не выполняет его finally, а тело отброшенного ответа закрывается именно так.
+    """
+
+    def __init__(self, body: AsyncIterator[bytes], release: Callable[[], None]):
+        self._body = body
+        self._release: Optional[Callable[[], None]] = release
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await self._body.__anext__()
+        except BaseException:
+            # Конец тела, ошибка чтения или отмена
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        self._free()
+        aclose = getattr(self._body, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    def _free(self) -> None:
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+    def __del__(self):
+        # Тело, которое никто не дочитал и не закрыл, не должно занимать место навсегда
+        self._free()
@@ -0,0 +1,87 @@
+"""
+Сохранение счётчиков между перезапусками:
+- SQLite-файл, одна строка на ключ состояния
+- Запись в фоновом потоке пачками раз в flush_interval, одной транзакцией с fsync (synchronous=FULL),
+  поэтому обработка запросов не ждёт диска
+- При потере процесса теряются изменения не больше чем за flush_interval
+"""
+import json
+import sqlite3
+import threading
+from typing import List
+
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class CounterStore:
+    """Персистентное хранилище векторов состояния по ключам."""
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        self._path = path
+        self._flush_interval = flush_interval
+        # Последнее состояние каждого изменённого ключа: промежуточные значения на диск не пишутся
+        self._pending: dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, state TEXT NOT NULL)")
+        self._thread = threading.Thread(target=self._run, name="counter-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def load(self) -> dict[str, List[float]]:
+        """
+        Читает сохранённые состояния.
+
+        Returns:
+            Словарь {ключ: вектор состояния}
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT key, state FROM counters").fetchall()
+        finally:
+            conn.close()
+        return {key: json.loads(state) for key, state in rows}
+
+    def save(self, key: str, state: List[float]) -> None:
+        """Запоминает состояние ключа для ближайшей записи на диск."""
+        with self._lock:
+            self._pending[key] = list(state)
+
+    def _flush(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO counters (key, state) VALUES (?, ?)",
+                [(key, json.dumps(state)) for key, state in batch.items()],
+            )
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            while True:
+                closing = self._closing.wait(self._flush_interval)
+                try:
+                    self._flush(conn)
+                except sqlite3.Error as e:
+                    logger.error(f"Не удалось сохранить счётчики в {self._path}: {repr(e)}")
+                if closing:
+                    break
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        """Записывает оставшиеся изменения и останавливает фоновый поток."""
+        self._closing.set()
+        self._thread.join()
@@ -0,0 +1,131 @@
+"""
+Индекс идентификаторов API для быстрого поиска по URL:
+- Словарь (extra, method) -> origin -> префиксное дерево сегментов пути
+- Поиск за O(глубины пути) независимо от количества идентификаторов
+"""
+import json
+from typing import Optional, List, Iterable
+
+from services.url_helper import URLHelper
+
+
+class _Node:
+    """Узел префиксного дерева: один сегмент пути."""
+
+    __slots__ = ("children", "identifier", "key")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.identifier: Optional[dict] = None
+        self.key: Optional[str] = None
+
+
+class IdentifierIndex:
+    """
+    Индекс идентификаторов по extra, методу, origin и сегментам пути.
+
+    Идентификатор совпадает с URL запроса, если его url равен одному из подпутей запроса:
+    origin и первые несколько сегментов пути. Идентификаторы, url которых не может совпасть ни с одним подпутём
+    (без пути, со слешем в конце, с query), в дерево не попадают.
+    """
+
+    def __init__(self):
+        self._roots: dict[tuple[str, str], dict[str, _Node]] = {}
+
+    def add(self, identifier_key: str) -> None:
+        """
+        Добавляет идентификатор в индекс.
+
+        Args:
+            identifier_key: JSON-строка идентификатора
+        """
+        identifier_dict = json.loads(identifier_key)
+        origin, path_parts = URLHelper.split_url(identifier_dict["url"])
+        if not path_parts or f"{origin}/{'/'.join(path_parts)}" != identifier_dict["url"]:
+            return
+
+        hosts = self._roots.setdefault((identifier_dict["extra"], identifier_dict["method"]), {})
+        node = hosts.setdefault(origin, _Node())
+        for part in path_parts:
+            node = node.children.setdefault(part, _Node())
+        node.identifier = identifier_dict
+        node.key = identifier_key
+
+    def find(self, url: str, method: str, extra: str) -> Optional[dict]:
+        """
+        Находит наиболее специфичный идентификатор для запроса.
+
+        Args:
+            url: URL запроса
+            method: HTTP метод запроса
+            extra: Дополнительный параметр идентификатора
+
+        Returns:
+            Словарь идентификатора или None, если совпадений нет
+        """
+        node = self._find_node(url, method, extra)
+        return dict(node.identifier) if node is not None else None
+
+    def find_key(self, url: str, method: str, extra: str) -> Optional[str]:
+        """
+        Находит ключ наиболее специфичного идентификатора для запроса.
+
+        Args:
+            url: URL запроса
+            method: HTTP метод запроса
+            extra: Дополнительный параметр идентификатора
+
+        Returns:
+            JSON-строка идентификатора или None, если совпадений нет
+        """
+        node = self._find_node(url, method, extra)
+        return node.key if node is not None else None
+
+    def _find_node(self, url: str, method: str, extra: str) -> Optional[_Node]:
+        origin, path_parts = URLHelper.split_url(url)
+        best, best_depth = None, 0
+        for node in self._origin_nodes(origin, extra, dict.fromkeys((method, "ANY"))):
+            for depth, part in enumerate(path_parts, start=1):
+                node = node.children.get(part)
+                if node is None:
+                    break
+                if node.identifier is not None and depth > best_depth:
+                    best, best_depth = node, depth
+        return best
+
+    def find_all(self, url: str, method: str, extra: str) -> List[dict]:
+        """
+        Находит все идентификаторы, чьи области действия включают URL.
+
+        Метод "ANY" совпадает с идентификаторами любого метода.
+
+        Args:
+            url: URL запроса
+            method: HTTP метод или "ANY"
+            extra: Дополнительный параметр идентификатора
+
+        Returns:
+            Список словарей идентификаторов, от самого специфичного к общему
+        """
+        origin, path_parts = URLHelper.split_url(url)
+        if method == "ANY":
+            methods = [m for (e, m) in self._roots if e == extra]
+        else:
+            methods = [method, "ANY"]
+
+        found = []
+        for node in self._origin_nodes(origin, extra, methods):
+            for part in path_parts:
+                node = node.children.get(part)
+                if node is None:
+                    break
+                if node.identifier is not None:
+                    found.append(dict(node.identifier))
+        found.sort(key=lambda identifier: identifier["url"].count('/'), reverse=True)
+        return found
+
+    def _origin_nodes(self, origin: str, extra: str, methods: Iterable[str]) -> Iterable[_Node]:
+        for method in methods:
+            node = self._roots.get((extra, method), {}).get(origin)
+            if node is not None:
+                yield node
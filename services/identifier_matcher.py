@@ -1,14 +1,16 @@
 """
 Сервис для работы с идентификаторами API:
 - Поиск подходящих идентификаторов по URL и методу
+- Кэширование результатов поиска для повторяющихся URL
 - Проверка конфликтов между идентификаторами
 - Валидация идентификаторов
 """
 import json
+from collections import OrderedDict
 from typing import Optional, List
 
 from logger import setup_logger
-from services.url_helper import URLHelper
+from services.identifier_index import IdentifierIndex
 
 logger = setup_logger(__name__)
 
@@ -16,15 +18,71 @@ logger = setup_logger(__name__)
 class IdentifierMatcher:
     """Сервис для сопоставления и проверки идентификаторов API."""
 
-    def __init__(self, api_manager):
+    def __init__(self, api_manager, cache_size: int = 4096):
         """
         Инициализация сервиса.
         
         Args:
             api_manager: Экземпляр APIManager для доступа к списку API
+            cache_size: Максимальное количество запомненных результатов resolve, 0 - без кэша
         """
         self._api_manager = api_manager
-        self._url_helper = URLHelper()
+        self._index = IdentifierIndex()
+        self._cache: OrderedDict[tuple[str, str, str], Optional[tuple]] = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    def resolve(self, url: str, method: str, extra: str) -> Optional[tuple]:
+        """
+        Находит ключ идентификатора и API-инстанс для запроса, запоминая результат.
+
+        Кэш сбрасывается при любом изменении набора идентификаторов.
+
+        Args:
+            url: URL запроса
+            method: HTTP метод
+            extra: Дополнительный параметр идентификатора
+
+        Returns:
+            Кортеж (ключ идентификатора, API-инстанс) или None, если API не найден
+        """
+        cache_key = (url, method, extra)
+        try:
+            result = self._cache[cache_key]
+        except KeyError:
+            self._cache_misses += 1
+        else:
+            self._cache_hits += 1
+            self._cache.move_to_end(cache_key)
+            return result
+
+        result = None
+        identifier_key = self._index.find_key(url, method, extra)
+        if identifier_key is not None:
+            api = self._api_manager.get(identifier_key)
+            if api is not None:
+                result = (identifier_key, api)
+
+        if self._cache_size > 0:
+            self._cache[cache_key] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def cache_info(self) -> dict:
+        """
+        Возвращает статистику кэша resolve.
+
+        Returns:
+            Словарь с количеством попаданий, промахов, текущим и максимальным размером
+        """
+        return {
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "size": len(self._cache),
+            "max_size": self._cache_size,
+        }
 
     def find_identifier(
         self,
@@ -48,36 +106,19 @@ class IdentifierMatcher:
             List[dict] - если first_match_only=False
             None - если идентификатор не найден
         """
-        matching_identifiers = []
-        
-        for identifier_key in self._api_manager.get_all_apis().keys():
-            identifier_dict = json.loads(identifier_key)
-            
-            if not self._matches_extra(identifier_dict, extra):
-                continue
-            
-            if not self._matches_method(identifier_dict, method, first_match_only):
-                continue
-            
-            # Проверяем все подпути URL
-            url_match = self._url_helper.find_matching_sub_url(
-                url, 
-                identifier_dict.get("url")
-            )
-            
-            if url_match:
-                matched_identifier = {
-                    "url": url_match,
-                    "method": identifier_dict.get("method"),
-                    "extra": extra
-                }
-                
-                if first_match_only:
-                    return matched_identifier
-                    
-                matching_identifiers.append(matched_identifier)
-        
-        return None if first_match_only else matching_identifiers
+        if first_match_only:
+            return self._index.find(url, method, extra)
+        return self._index.find_all(url, method, extra)
+
+    def register(self, identifier_key: str) -> None:
+        """
+        Добавляет идентификатор в индекс поиска.
+
+        Args:
+            identifier_key: JSON-строка идентификатора
+        """
+        self._index.add(identifier_key)
+        self._cache.clear()
 
     def check_conflict(self, identifier_str: str) -> List[dict]:
         """
@@ -125,38 +166,3 @@ class IdentifierMatcher:
             True если есть конфликты, False иначе
         """
         return len(self.check_conflict(identifier_str)) > 0
-
-    @staticmethod
-    def _matches_extra(identifier_dict: dict, extra: str) -> bool:
-        """Проверяет соответствие extra параметра."""
-        return identifier_dict.get("extra", "") == extra
-
-    @staticmethod
-    def _matches_method(identifier_dict: dict, method: str, first_match_only: bool) -> bool:
-        """
-        Проверяет соответствие HTTP метода.
-        
-        Args:
-            identifier_dict: Словарь идентификатора
-            method: HTTP метод для проверки
-            first_match_only: Флаг, влияющий на логику проверки метода
-            
-        Returns:
-            True если метод соответствует, False иначе
-        """
-        identifier_method = identifier_dict.get("method", "")
-        
-        # Если методы точно совпадают
-        if method == identifier_method:
-            return True
-        
-        # Если идентификатор поддерживает любой метод
-        if identifier_method == "ANY":
-            return True
-        
-        # Если ищем любой метод, но это не первый поиск
-        if method == "ANY" and not first_match_only:
-            return True
-        
-        return False
-
@@ -0,0 +1,134 @@
+"""
+Метрики лимитера в текстовом формате Prometheus.
+
+Счётчики и гистограммы - обычные числа в памяти процесса: их меняет только event loop,
+поэтому блокировки не нужны, а учёт на пути запроса стоит сотни наносекунд.
+Значения, которые есть в самих объектах (глубина очереди, запросы в полёте, остаток RPD),
+снимаются в момент запроса метрик.
+"""
+from bisect import bisect_left
+
+# Границы корзин гистограмм времени, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Причины, по которым запрос не отправлен во внешний API
+REJECT_REASONS = ("shed", "rpd", "expired")
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами."""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Последняя корзина - значения больше всех границ (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class APIMetrics:
+    """Метрики одного идентификатора."""
+
+    __slots__ = ("queue_wait", "upstream_latency", "sent", "throttled", "errors", "rejected")
+
+    def __init__(self):
+        # Время от постановки в очередь до отправки во внешний API
+        self.queue_wait = Histogram()
+        # Время от отправки до заголовков ответа внешнего API
+        self.upstream_latency = Histogram()
+        self.sent = 0
+        # Ответы 429 внешнего API
+        self.throttled = 0
+        # Ошибки соединения и ответы 5xx
+        self.errors = 0
+        self.rejected = dict.fromkeys(REJECT_REASONS, 0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Writer:
+    """Собирает текст в формате Prometheus, группируя значения по метрикам."""
+
+    def __init__(self):
+        self._metrics: dict[str, tuple[str, str, list[str]]] = {}
+
+    def add(self, name: str, kind: str, help_text: str, value, labels: dict = None, suffix: str = "") -> None:
+        _, _, samples = self._metrics.setdefault(name, (kind, help_text, []))
+        label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in (labels or {}).items())
+        samples.append(f"{name}{suffix}{{{label_text}}} {value}" if label_text else f"{name}{suffix} {value}")
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram, labels: dict) -> None:
+        cumulative = 0
+        for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+            cumulative += count
+            self.add(name, "histogram", help_text, cumulative, {**labels, "le": bound}, "_bucket")
+        self.add(name, "histogram", help_text, histogram.sum, labels, "_sum")
+        self.add(name, "histogram", help_text, cumulative, labels, "_count")
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, samples) in self._metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+async def render_metrics(api_manager) -> str:
+    """
+    Формирует метрики всех API в текстовом формате Prometheus.
+
+    Args:
+        api_manager: Менеджер API
+
+    Returns:
+        Текст для ответа на запрос Prometheus
+    """
+    writer = _Writer()
+    for identifier, api in api_manager.get_all_apis().items():
+        labels = {"identifier": identifier}
+        metrics = api.metrics
+        writer.add("ratelimiter_queue_depth", "gauge", "Requests waiting in the queue.", api.queue.qsize(), labels)
+        writer.add("ratelimiter_in_flight", "gauge", "Requests sent and waiting for the API response.",
+                   api.concurrency.in_flight, labels)
+        writer.histogram("ratelimiter_queue_wait_seconds", "Time from queuing to sending.", metrics.queue_wait, labels)
+        writer.histogram("ratelimiter_upstream_latency_seconds", "Time from sending to the API response headers.",
+                         metrics.upstream_latency, labels)
+        writer.add("ratelimiter_requests_sent_total", "counter", "Requests sent to the API.", metrics.sent, labels)
+        gap = api.limiter.gap
+        writer.add("ratelimiter_configured_rate", "gauge", "Requests per second allowed by the limit rules.",
+                   1 / gap if gap > 0 else "+Inf", labels)
+        writer.add("ratelimiter_upstream_throttled_total", "counter", "429 responses of the API.",
+                   metrics.throttled, labels)
+        writer.add("ratelimiter_upstream_errors_total", "counter", "Connection errors and 5xx responses of the API.",
+                   metrics.errors, labels)
+        for reason, count in metrics.rejected.items():
+            writer.add("ratelimiter_rejected_total", "counter", "Requests answered without sending them to the API.",
+                       count, {**labels, "reason": reason})
+        if api.daily is not None:
+            try:
+                remaining = await api.daily.remaining()
+            except Exception:
+                # Хранилище состояния недоступно: остаток просто не публикуется
+                remaining = None
+            if remaining is not None:
+                writer.add("ratelimiter_rpd_remaining", "gauge", "RPD units left in the current period.",
+                           remaining, labels)
+
+    cache = api_manager.get_response_cache().info()
+    for key in ("hits", "misses", "revalidated"):
+        writer.add(f"ratelimiter_response_cache_{key}_total", "counter", f"Response cache {key}.", cache[key])
+    writer.add("ratelimiter_response_cache_bytes", "gauge", "Memory taken by cached responses.", cache["bytes"])
+    resolution = api_manager.get_identifier_matcher().cache_info()
+    writer.add("ratelimiter_resolution_cache_hits_total", "counter", "Identifier lookup cache hits.",
+               resolution["hits"])
+    writer.add("ratelimiter_resolution_cache_misses_total", "counter", "Identifier lookup cache misses.",
+               resolution["misses"])
+    return writer.render()
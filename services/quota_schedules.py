@@ -0,0 +1,217 @@
+"""
+Расписания сброса дневного лимита (RPD):
+- daily: календарные сутки в заданном часовом поясе (по умолчанию - локальное время сервера, "UTC" - полночь UTC)
+- monthly: календарный месяц в заданном часовом поясе
+- rolling_24h: скользящие 24 часа, счётчики по часам
+
+QuotaCounter - лимит по расписанию (RPD идентификатора, квота клиента) поверх хранилища состояния.
+
+Счётчик, как и состояние правил, - вектор чисел в хранилище состояния.
+Период сменяется лениво, при первом обращении после его окончания, поэтому отдельная фоновая задача сброса не нужна.
+"""
+import asyncio
+import math
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+from schemas import RateLimitModel
+from services.clock import SYSTEM_CLOCK, Clock
+from services.state_backends import StateBackend
+
+
+class QuotaSchedule:
+    """Счётчик запросов за период."""
+
+    state_size = 2
+
+    def initial_state(self) -> List[float]:
+        """Возвращает состояние счётчика до первого запроса."""
+        return [0.0] * self.state_size
+
+    def used(self, state: List[float], now: float) -> int:
+        """
+        Возвращает, сколько запросов учтено в текущем периоде.
+
+        Args:
+            state: Состояние счётчика, при смене периода сбрасывается на месте
+            now: Текущее время, unix timestamp
+        """
+        raise NotImplementedError
+
+    def add(self, state: List[float], now: float, count: int) -> None:
+        """Учитывает count запросов (отрицательное значение возвращает неиспользованные)."""
+        raise NotImplementedError
+
+    def expires(self, now: float) -> float:
+        """Момент, до которого учтённые сейчас запросы относятся к текущему периоду."""
+        raise NotImplementedError
+
+
+class CalendarSchedule(QuotaSchedule):
+    """Календарные сутки или месяц. Состояние: [начало периода, счётчик]."""
+
+    def __init__(self, monthly: bool, tz: Optional[ZoneInfo]):
+        self._monthly = monthly
+        self._tz = tz
+        # Границы текущего периода кэшируются: пересчёт дат нужен раз в период
+        self._start = self._end = -math.inf
+
+    def _bounds(self, now: float) -> tuple[float, float]:
+        if not self._start <= now < self._end:
+            day = datetime.fromtimestamp(now, self._tz).date()
+            if self._monthly:
+                first = day.replace(day=1)
+                following = (first + timedelta(days=32)).replace(day=1)
+            else:
+                first, following = day, day + timedelta(days=1)
+            self._start, self._end = self._midnight(first), self._midnight(following)
+        return self._start, self._end
+
+    def _midnight(self, day: date) -> float:
+        # Без часового пояса datetime.timestamp() считает время локальным, с учётом перехода на летнее время
+        return datetime.combine(day, dt_time(0), tzinfo=self._tz).timestamp()
+
+    def _roll(self, state, now):
+        start, _ = self._bounds(now)
+        if state[0] != start:
+            state[0], state[1] = start, 0
+
+    def used(self, state, now):
+        self._roll(state, now)
+        return int(state[1])
+
+    def add(self, state, now, count):
+        self._roll(state, now)
+        state[1] = max(0, state[1] + count)
+
+    def expires(self, now):
+        return self._bounds(now)[1]
+
+
+class RollingSchedule(QuotaSchedule):
+    """
+    Скользящие 24 часа по часовым корзинам.
+
+    Учитываются запросы текущего часа и 24 предыдущих, то есть окно от 24 до 25 часов:
+    лимит не превышается ни в каких 24 часах.
+    Состояние: [номер часа последнего обращения, 25 счётчиков по часам].
+    """
+
+    HOURS = 25
+    state_size = HOURS + 1
+
+    def _roll(self, state, now):
+        hour = math.floor(now / 3600)
+        last = int(state[0])
+        if hour - last >= self.HOURS:
+            state[1:] = [0.0] * self.HOURS
+        else:
+            for passed in range(last + 1, hour + 1):
+                state[1 + passed % self.HOURS] = 0
+        state[0] = max(last, hour)
+        return hour
+
+    def used(self, state, now):
+        self._roll(state, now)
+        return int(sum(state[1:]))
+
+    def add(self, state, now, count):
+        hour = self._roll(state, now)
+        position = 1 + hour % self.HOURS
+        state[position] = max(0, state[position] + count)
+
+    def expires(self, now):
+        return math.inf
+
+
+def build_schedule(rate_limit: RateLimitModel) -> QuotaSchedule:
+    """Создаёт расписание сброса RPD по конфигурации идентификатора."""
+    if rate_limit.rpd_reset == "rolling_24h":
+        return RollingSchedule()
+    tz = ZoneInfo(rate_limit.rpd_timezone) if rate_limit.rpd_timezone else None
+    return CalendarSchedule(rate_limit.rpd_reset == "monthly", tz)
+
+
+class QuotaCounter:
+    """
+    Лимит запросов за период по расписанию, с учётом в хранилище состояния.
+
+    Единицы берутся из хранилища пачками по lease_size хранилища и расходуются локально,
+    возвращённые единицы достаются следующим запросам этого процесса.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        limit: int,
+        schedule: QuotaSchedule,
+        backend: StateBackend,
+        clock: Clock = SYSTEM_CLOCK
+    ):
+        self._key = key
+        self._limit = limit
+        self._schedule = schedule
+        self._backend = backend
+        self._clock = clock
+        # Единицы, уже взятые из хранилища, но ещё не потраченные, и момент, до которого они действительны
+        self._lease = 0
+        self._lease_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def reserve(self) -> bool:
+        """
+        Учитывает запрос в лимите текущего периода.
+
+        Returns:
+            False, если лимит на период исчерпан
+        """
+        now = self._clock.time()
+        lease_size = self._backend.lease_size
+
+        def take(state):
+            granted = max(0, min(lease_size, self._limit - self._schedule.used(state, now)))
+            self._schedule.add(state, now, granted)
+            return granted
+
+        # Пока один запрос пополняет запас из хранилища, остальные ждут его, а не берут свои пачки
+        async with self._lock:
+            if now >= self._lease_until:
+                # Запас взят в прошлом периоде и к новому не относится
+                self._lease = 0
+            if self._lease == 0:
+                self._lease = await self._backend.transact(
+                    self._key, self._schedule.initial_state(), take, durable=True
+                )
+                self._lease_until = self._schedule.expires(now)
+            if self._lease == 0:
+                return False
+            self._lease -= 1
+            return True
+
+    def refund(self) -> None:
+        """Возвращает единицу запроса, который так и не был отправлен во внешний API."""
+        if self._clock.time() < self._lease_until:
+            # Единица уже учтена в хранилище, поэтому она просто достанется следующему запросу
+            self._lease += 1
+
+    async def remaining(self) -> int:
+        """Возвращает, сколько запросов ещё можно сделать в текущем периоде, включая запас этого процесса."""
+        now = self._clock.time()
+        used = await self._backend.transact(
+            self._key, self._schedule.initial_state(), lambda state: self._schedule.used(state, now)
+        )
+        lease = self._lease if now < self._lease_until else 0
+        return max(0, self._limit - used) + lease
+
+    async def release(self) -> None:
+        """Возвращает в хранилище невостребованные единицы, чтобы их могли потратить другие экземпляры."""
+        now = self._clock.time()
+        unused, self._lease = self._lease, 0
+        if not unused or now >= self._lease_until:
+            return
+
+        await self._backend.transact(
+            self._key, self._schedule.initial_state(),
+            lambda state: self._schedule.add(state, now, -unused), durable=True
+        )
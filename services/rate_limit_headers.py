@@ -0,0 +1,78 @@
+"""
+Разбор заголовков, которыми внешние API сообщают о своих лимитах:
+- Retry-After (секунды или HTTP-дата)
+- X-RateLimit-Remaining / X-RateLimit-Reset (секунды до сброса или unix timestamp)
+- IETF RateLimit-Remaining / RateLimit-Reset и структурный RateLimit ("remaining=5, reset=30" или "r=5;t=30")
+"""
+import re
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# Значения reset больше этого считаются unix timestamp, а не количеством секунд
+_TIMESTAMP_THRESHOLD = 1e9
+
+_PARAM_RE = re.compile(r'(\w+)\s*=\s*"?([\d.]+)"?')
+
+
+@dataclass
+class RateLimitFeedback:
+    """Сведения о лимите из ответа внешнего API. Все времена - секунды от текущего момента."""
+    retry_after: Optional[float] = None
+    remaining: Optional[float] = None
+    reset: Optional[float] = None
+
+
+def _parse_seconds(value: Optional[str], now: float) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+        except (TypeError, ValueError):
+            return None
+    if seconds > _TIMESTAMP_THRESHOLD:
+        seconds -= now
+    return max(0.0, seconds)
+
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_rate_limit_headers(headers, now: float) -> RateLimitFeedback:
+    """
+    Извлекает сведения о лимите из заголовков ответа.
+
+    Args:
+        headers: Заголовки ответа (регистронезависимый Mapping)
+        now: Текущее время, unix timestamp
+
+    Returns:
+        RateLimitFeedback, в котором не найденные значения равны None
+    """
+    feedback = RateLimitFeedback(
+        retry_after=_parse_seconds(headers.get("retry-after"), now),
+        remaining=_parse_number(headers.get("x-ratelimit-remaining") or headers.get("ratelimit-remaining")),
+        reset=_parse_seconds(headers.get("x-ratelimit-reset") or headers.get("ratelimit-reset"), now),
+    )
+
+    structured = headers.get("ratelimit")
+    if structured:
+        params = dict(_PARAM_RE.findall(structured))
+        remaining = params.get("remaining", params.get("r"))
+        reset = params.get("reset", params.get("t"))
+        remaining = _parse_number(remaining)
+        if remaining is not None:
+            feedback.remaining = remaining
+        if reset is not None:
+            feedback.reset = _parse_seconds(reset, now)
+
+    return feedback
@@ -0,0 +1,381 @@
+"""
+Алгоритмы ограничения частоты запросов:
+- Фиксированный интервал между запросами (interval из конфига)
+- Token bucket с burst
+- Фиксированное окно произвольной длины
+- Скользящее окно: точный журнал отправок и приближённый счётчик
+- Обратная связь: пауза и темп, которые сообщает сам внешний API (429, Retry-After, RateLimit-*)
+
+Правила не хранят состояние сами: оно передаётся в виде списка чисел фиксированной длины.
+Так одно и то же правило может работать с состоянием в памяти процесса или во внешнем хранилище.
+"""
+import math
+from collections import deque
+from random import random
+from typing import List
+
+from schemas import LimitRuleModel, RateLimitModel
+from services.rate_limit_headers import RateLimitFeedback
+from services.state_backends import StateBackend
+
+
+class LimitRule:
+    """Базовое правило ограничения частоты."""
+
+    state_size = 1
+
+    def initial_state(self) -> List[float]:
+        """Возвращает состояние правила до первого запроса."""
+        return [0.0] * self.state_size
+
+    def delay(self, state: List[float], now: float) -> float:
+        """
+        Возвращает, сколько секунд нужно подождать, чтобы правило разрешило запрос.
+
+        Args:
+            state: Состояние правила
+            now: Текущее время, unix timestamp
+
+        Returns:
+            0, если запрос можно отправить сейчас, иначе время ожидания в секундах
+        """
+        raise NotImplementedError
+
+    def consume(self, state: List[float], now: float) -> None:
+        """
+        Учитывает отправку запроса в момент now, изменяя состояние на месте.
+
+        Args:
+            state: Состояние правила
+            now: Момент отправки, unix timestamp
+        """
+        raise NotImplementedError
+
+    @property
+    def gap(self) -> float:
+        """Средний промежуток между запросами при длительной нагрузке, в секундах."""
+        raise NotImplementedError
+
+
+class IntervalRule(LimitRule):
+    """Не чаще одного запроса за interval секунд (с запасом 10% и опциональной случайной добавкой)."""
+
+    def __init__(self, interval: float, add_random: bool = False):
+        self._interval = interval * 1.1
+        self._add_random = add_random
+
+    def delay(self, state, now):
+        return max(0.0, state[0] - now)
+
+    def consume(self, state, now):
+        state[0] = now + self._interval + (random() if self._add_random else 0)
+
+    @property
+    def gap(self):
+        return self._interval + (0.5 if self._add_random else 0)
+
+
+class TokenBucketRule(LimitRule):
+    """limit запросов за period секунд, до burst запросов подряд. Состояние: [токены, время пополнения]."""
+
+    state_size = 2
+
+    def __init__(self, limit: int, period: float, burst: int):
+        self._rate = limit / period
+        self._capacity = burst
+
+    def initial_state(self):
+        return [float(self._capacity), 0.0]
+
+    def _refill(self, state, now):
+        if now > state[1]:
+            state[0] = min(self._capacity, state[0] + (now - state[1]) * self._rate)
+            state[1] = now
+
+    def delay(self, state, now):
+        tokens = state[0]
+        if now > state[1]:
+            tokens = min(self._capacity, tokens + (now - state[1]) * self._rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self._rate + max(0.0, state[1] - now)
+
+    def consume(self, state, now):
+        self._refill(state, now)
+        state[0] -= 1
+
+    @property
+    def gap(self):
+        return 1 / self._rate
+
+
+class FixedWindowRule(LimitRule):
+    """limit запросов в окне длиной period, окна выровнены по эпохе. Состояние: [начало окна, счётчик]."""
+
+    state_size = 2
+
+    def __init__(self, limit: int, period: float):
+        self._limit = limit
+        self._period = period
+
+    def _window(self, now):
+        return math.floor(now / self._period) * self._period
+
+    def delay(self, state, now):
+        window = self._window(now)
+        if window != state[0] or state[1] < self._limit:
+            return 0.0
+        return window + self._period - now
+
+    def consume(self, state, now):
+        window = self._window(now)
+        if window != state[0]:
+            state[0], state[1] = window, 0
+        state[1] += 1
+
+    @property
+    def gap(self):
+        return self._period / self._limit
+
+
+class SlidingWindowLogRule(LimitRule):
+    """
+    Не больше limit запросов за любые period секунд, точно.
+
+    Состояние: [позиция в кольце, время отправки последних limit запросов...].
+    """
+
+    def __init__(self, limit: int, period: float):
+        self._limit = limit
+        self._period = period
+        self.state_size = limit + 1
+
+    def initial_state(self):
+        return [0.0] + [-math.inf] * self._limit
+
+    def delay(self, state, now):
+        oldest = state[1 + int(state[0])]
+        return max(0.0, oldest + self._period - now)
+
+    def consume(self, state, now):
+        position = int(state[0])
+        state[1 + position] = now
+        state[0] = (position + 1) % self._limit
+
+    @property
+    def gap(self):
+        return self._period / self._limit
+
+
+class SlidingWindowCounterRule(LimitRule):
+    """
+    Не больше limit запросов за скользящее окно period, приближённо по счётчикам двух соседних окон.
+
+    Состояние: [начало текущего окна, счётчик прошлого окна, счётчик текущего окна].
+    """
+
+    state_size = 3
+
+    def __init__(self, limit: int, period: float):
+        self._limit = limit
+        self._period = period
+
+    def _roll(self, state, now):
+        window = math.floor(now / self._period) * self._period
+        if window == state[0]:
+            return state[1], state[2], window
+        if window == state[0] + self._period:
+            return state[2], 0.0, window
+        return 0.0, 0.0, window
+
+    def delay(self, state, now):
+        previous, current, window = self._roll(state, now)
+        free = self._limit - 1 - current
+        if free < 0:
+            # В текущем окне места нет: ждём следующее, где прошлым станет текущее
+            previous, free, window = current, self._limit - 1, window + self._period
+        if previous <= free:
+            return max(0.0, window - now)
+        allowed_at = window + self._period * (1 - free / previous)
+        return max(0.0, allowed_at - now)
+
+    def consume(self, state, now):
+        previous, current, window = self._roll(state, now)
+        state[0], state[1], state[2] = window, previous, current + 1
+
+    @property
+    def gap(self):
+        return self._period / self._limit
+
+
+class FeedbackRule(LimitRule):
+    """
+    Ограничения, которые сообщает сам внешний API.
+
+    Состояние: [пауза до, промежуток между запросами, темп действует до, время последней отправки].
+    """
+
+    state_size = 4
+
+    def delay(self, state, now):
+        delay = state[0] - now
+        if now < state[2]:
+            delay = max(delay, state[3] + state[1] - now)
+        return max(0.0, delay)
+
+    def consume(self, state, now):
+        state[3] = now
+
+    @staticmethod
+    def pause(state, until: float) -> None:
+        """Запрещает отправку до момента until."""
+        state[0] = max(state[0], until)
+
+    @staticmethod
+    def set_pace(state, gap: float, until: float) -> None:
+        """Задаёт промежуток между запросами, действующий до момента until."""
+        state[1], state[2] = gap, until
+
+    @property
+    def gap(self):
+        return 0.0
+
+
+def build_rule(cfg: LimitRuleModel) -> LimitRule:
+    """Создаёт правило по его конфигурации."""
+    if cfg.type == "token_bucket":
+        return TokenBucketRule(cfg.limit, cfg.period, cfg.burst or cfg.limit)
+    if cfg.type == "fixed_window":
+        return FixedWindowRule(cfg.limit, cfg.period)
+    if cfg.type == "sliding_window_log":
+        return SlidingWindowLogRule(cfg.limit, cfg.period)
+    return SlidingWindowCounterRule(cfg.limit, cfg.period)
+
+
+class RateLimiter:
+    """
+    Набор правил идентификатора, применяемых совместно: запрос уходит, когда его разрешают все правила.
+
+    Состояния всех правил хранятся одним вектором в хранилище состояния под ключом идентификатора,
+    поэтому несколько процессов с общим хранилищем соблюдают один и тот же лимит.
+
+    Если хранилище выдаёт разрешения пачками (lease_size > 1), за одно обращение занимается
+    несколько ближайших моментов отправки, и следующие запросы берут их локально.
+    """
+
+    def __init__(self, rate_limit: RateLimitModel, backend: StateBackend, key: str):
+        self.rules: List[LimitRule] = [IntervalRule(rate_limit.interval, rate_limit.add_random)]
+        self.rules += [build_rule(cfg) for cfg in rate_limit.limits]
+        self.feedback_rule = FeedbackRule() if rate_limit.feedback else None
+        if self.feedback_rule is not None:
+            self.rules.append(self.feedback_rule)
+
+        self._backend = backend
+        self._key = key
+        self._leased: deque[float] = deque()
+        self._initial: List[float] = []
+        self._bounds: List[tuple[int, int]] = []
+        for rule in self.rules:
+            state = rule.initial_state()
+            self._bounds.append((len(self._initial), len(self._initial) + len(state)))
+            self._initial += state
+
+    @property
+    def gap(self) -> float:
+        """Средний промежуток между запросами, который допускают все правила вместе."""
+        return max(rule.gap for rule in self.rules)
+
+    def _split(self, flat: List[float]) -> List[List[float]]:
+        return [flat[start:end] for start, end in self._bounds]
+
+    def _join(self, flat: List[float], states: List[List[float]]) -> None:
+        for (start, end), state in zip(self._bounds, states):
+            flat[start:end] = state
+
+    def _delay(self, states: List[List[float]], now: float) -> float:
+        return max(rule.delay(state, now) for rule, state in zip(self.rules, states))
+
+    def _acquire(self, flat: List[float], now: float, count: int) -> List[float]:
+        states = self._split(flat)
+        slots = []
+        send_at = now
+        for _ in range(count):
+            # Ожидание одного правила может упереться в другое, поэтому проверяем до совпадения.
+            # Минимальный шаг не даёт зациклиться на погрешности округления у границы окна
+            while (delay := self._delay(states, send_at)) > 0:
+                send_at += max(delay, 1e-6)
+            for rule, state in zip(self.rules, states):
+                rule.consume(state, send_at)
+            slots.append(send_at)
+        self._join(flat, states)
+        return slots
+
+    def _drop_stale(self, now: float) -> None:
+        # Отправка заметно позже занятого момента может сдвинуть запрос в следующее окно
+        # и превысить лимит там, поэтому просроченные моменты не используются
+        while self._leased and self._leased[0] < now - self.gap:
+            self._leased.popleft()
+
+    async def delay(self, now: float) -> float:
+        """Возвращает время ожидания до момента, когда запрос разрешат все правила."""
+        self._drop_stale(now)
+        if self._leased:
+            return max(0.0, self._leased[0] - now)
+        return await self._backend.transact(
+            self._key, self._initial, lambda flat: self._delay(self._split(flat), now)
+        )
+
+    async def acquire(self, now: float, demand: int = 1) -> float:
+        """
+        Занимает ближайший разрешённый всеми правилами момент отправки.
+
+        Args:
+            now: Текущее время, unix timestamp
+            demand: Сколько запросов ждут отправки; столько моментов (не больше lease_size хранилища)
+                занимается за одно обращение к хранилищу
+
+        Returns:
+            Момент, когда можно отправлять запрос (не раньше now)
+        """
+        self._drop_stale(now)
+        if not self._leased:
+            count = max(1, min(demand, self._backend.lease_size))
+            self._leased.extend(await self._backend.transact(
+                self._key, self._initial, lambda flat: self._acquire(flat, now, count)
+            ))
+        return self._leased.popleft()
+
+    async def apply_feedback(self, feedback: RateLimitFeedback, now: float, throttled: bool, attempt: int) -> None:
+        """
+        Подстраивает отправку под лимиты, которые сообщил внешний API.
+
+        Без Retry-After и сведений о сбросе ответ 429 ставит отправку на паузу
+        с экспоненциальной задержкой по номеру попытки.
+
+        Args:
+            feedback: Сведения о лимите из заголовков ответа
+            now: Момент получения ответа, unix timestamp
+            throttled: True, если внешний API ответил 429
+            attempt: Номер попытки отправки запроса, начиная с 0
+        """
+        if self.feedback_rule is None:
+            return
+        start, end = self._bounds[self.rules.index(self.feedback_rule)]
+
+        def update(flat: List[float]) -> None:
+            state = flat[start:end]
+            if feedback.retry_after is not None:
+                self.feedback_rule.pause(state, now + feedback.retry_after)
+            elif throttled and not (feedback.remaining is not None and feedback.reset is not None):
+                self.feedback_rule.pause(state, now + max(1.0, self.gap) * 2 ** attempt)
+
+            if feedback.remaining is not None and feedback.reset is not None:
+                if feedback.remaining < 1:
+                    self.feedback_rule.pause(state, now + feedback.reset)
+                else:
+                    # Оставшиеся запросы равномерно распределяются до сброса лимита
+                    self.feedback_rule.set_pace(state, feedback.reset / feedback.remaining, now + feedback.reset)
+            flat[start:end] = state
+
+        await self._backend.transact(self._key, self._initial, update)
+        if throttled or feedback.retry_after is not None or feedback.remaining is not None:
+            # Занятые заранее моменты могут попасть на паузу или не соответствовать новому темпу
+            self._leased.clear()
@@ -0,0 +1,292 @@
+"""
+Журнал запросов долговечных идентификаторов (durable), чтобы очередь переживала перезапуск:
+- Каталог сегментов JSONL: запись о принятом запросе {"id", "api", "method", "url", ...} и отметка о завершении {"done": id}
+- Запись в фоновом потоке с групповым fsync: всё, что накопилось за время предыдущего fsync, пишется одной пачкой,
+  поэтому постановка в очередь не ждёт диска
+- Отметка о завершении пишется в сегмент самого запроса. Сегмент удаляется, когда все его запросы завершены;
+  новый начинается, когда текущий превысил segment_size
+- При запуске незавершённые запросы читаются, переписываются в новый сегмент и снова ставятся в очереди.
+  Запрос, отправленный перед сбоем, но не отмеченный завершённым, будет отправлен повторно (at-least-once)
+- Каждый процесс (uvicorn --workers N) пишет в свой подкаталог 0, 1, ..., занятый файловой блокировкой.
+  При запуске процесс забирает и незавершённые запросы подкаталогов, которые никем не заняты,
+  поэтому они не теряются и при меньшем числе процессов
+"""
+import asyncio
+import base64
+import json
+import os
+import threading
+from itertools import count
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from logger import setup_logger
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: блокировки нет, все процессы пишут в подкаталог 0, поэтому процесс должен быть один
+    fcntl = None
+
+logger = setup_logger(__name__)
+
+SEGMENT_SUFFIX = ".jsonl"
+LOCK_FILE = "lock"
+
+# Сегменты хранят заголовки запросов, в том числе Authorization и Cookie: читать их может только владелец
+SEGMENT_MODE = 0o600
+
+
+def encode_body(data: Optional[bytes]) -> Optional[str]:
+    return None if data is None else base64.b64encode(data).decode()
+
+
+def decode_body(data: Optional[str]) -> Optional[bytes]:
+    return None if data is None else base64.b64decode(data)
+
+
+def _settle(fut: asyncio.Future, error: Optional[OSError]) -> None:
+    if fut.done():
+        return
+    if error is None:
+        fut.set_result(None)
+    else:
+        fut.set_exception(error)
+
+
+class RequestJournal:
+    """Журнал принятых и ещё не завершённых запросов."""
+
+    def __init__(self, path: str, segment_size: int):
+        self._root = Path(path)
+        self._root.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self._lock_fd: Optional[int] = None
+        self._dir = self._acquire_slot()
+        self._segment_size = segment_size
+        self._next_id = 1
+        # Учёт ведётся в потоке event loop: сегмент каждого незавершённого запроса и число таких запросов в сегменте
+        self._records: dict[int, int] = {}
+        self._outstanding: dict[int, int] = {}
+        self._segment = 0
+        self._segment_bytes = 0
+        # Очередь фонового потока: (номер сегмента, строка) или (номер сегмента, None) - удалить сегмент
+        self._buffer: list[tuple[int, Optional[bytes]]] = []
+        self._waiters: list[asyncio.Future] = []
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _try_lock(directory: Path) -> Optional[int]:
+        """Занимает подкаталог журнала. Returns: дескриптор файла блокировки или None, если занят другим процессом."""
+        directory.mkdir(mode=0o700, exist_ok=True)
+        fd = os.open(directory / LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return None
+        return fd
+
+    def _acquire_slot(self) -> Path:
+        """Занимает первый свободный подкаталог 0, 1, ... на время работы процесса."""
+        for slot in count():
+            directory = self._root / str(slot)
+            self._lock_fd = self._try_lock(directory)
+            if self._lock_fd is not None:
+                return directory
+
+    @staticmethod
+    def _segments(directory: Path) -> list[Path]:
+        return sorted((p for p in directory.glob(f"*{SEGMENT_SUFFIX}") if p.stem.isdigit()), key=lambda p: int(p.stem))
+
+    @staticmethod
+    def _read_pending(segments: list[Path]) -> list[dict]:
+        """Незавершённые запросы сегментов одного подкаталога в порядке поступления."""
+        pending: dict[int, dict] = {}
+        for path in segments:
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Оборванная при сбое последняя строка
+                        logger.warning(f"Журнал запросов: пропущена повреждённая запись в сегменте {path}")
+                        continue
+                    if "done" in record:
+                        pending.pop(record["done"], None)
+                    else:
+                        pending[record["id"]] = record
+        return list(pending.values())
+
+    def _segment_path(self, segment: int) -> Path:
+        return self._dir / f"{segment:08d}{SEGMENT_SUFFIX}"
+
+    def _open_segment(self, segment: int) -> BinaryIO:
+        fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, SEGMENT_MODE)
+        return os.fdopen(fd, "ab")
+
+    def recover(self) -> list[dict]:
+        """
+        Читает незавершённые запросы и запускает фоновую запись.
+
+        Незавершённые запросы своего подкаталога и подкаталогов, не занятых другими процессами,
+        переписываются в новый сегмент под новыми номерами, прочитанные сегменты удаляются.
+
+        Returns:
+            Записи незавершённых запросов в порядке поступления
+        """
+        own = self._segments(self._dir)
+        read = list(own)
+        pending = self._read_pending(own)
+        adopted = []
+        for directory in sorted(p for p in self._root.iterdir() if p.is_dir() and p != self._dir):
+            fd = self._try_lock(directory)
+            if fd is None:
+                continue
+            adopted.append(fd)
+            segments = self._segments(directory)
+            read += segments
+            pending += self._read_pending(segments)
+
+        self._segment = (int(own[-1].stem) + 1) if own else 1
+        try:
+            if pending:
+                # Номера записей свои у каждого подкаталога, поэтому в новом сегменте они назначаются заново
+                for record in pending:
+                    record["id"] = self._next_id
+                    self._next_id += 1
+                lines = [json.dumps(record).encode() + b"\n" for record in pending]
+                self._write_now(self._segment, lines)
+                self._records = {record["id"]: self._segment for record in pending}
+                self._outstanding[self._segment] = len(pending)
+                self._segment_bytes = sum(map(len, lines))
+            for path in read:
+                path.unlink()
+        finally:
+            for fd in adopted:
+                os.close(fd)
+        if pending:
+            logger.info(f"Журнал запросов: восстановлено незавершённых запросов: {len(pending)}")
+
+        self._thread = threading.Thread(target=self._run, name="request-journal", daemon=True)
+        self._thread.start()
+        return pending
+
+    def _write_now(self, segment: int, lines: list[bytes]) -> None:
+        with self._open_segment(segment) as f:
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, record: dict) -> int:
+        """
+        Записывает принятый запрос (без ожидания диска).
+
+        Args:
+            record: Запрос: api, method, url, headers, params, body (base64), priority, tenant, deadline
+
+        Returns:
+            Номер записи для complete
+        """
+        record_id = record["id"] = self._next_id
+        self._next_id += 1
+        line = json.dumps(record).encode() + b"\n"
+        if self._segment_bytes >= self._segment_size:
+            self._rotate()
+        self._segment_bytes += len(line)
+        self._records[record_id] = self._segment
+        self._outstanding[self._segment] = self._outstanding.get(self._segment, 0) + 1
+        self._put(self._segment, line)
+        return record_id
+
+    def complete(self, record_id: int) -> None:
+        """Отмечает запрос завершённым: после перезапуска он не будет отправлен."""
+        segment = self._records.pop(record_id, None)
+        if segment is None:
+            return
+        self._outstanding[segment] -= 1
+        if not self._outstanding[segment] and segment != self._segment:
+            del self._outstanding[segment]
+            self._put(segment, None)
+        else:
+            # Отметка пишется в сегмент запроса: удаление другого сегмента не может её потерять
+            self._put(segment, json.dumps({"done": record_id}).encode() + b"\n")
+
+    def _rotate(self) -> None:
+        previous = self._segment
+        self._segment += 1
+        self._segment_bytes = 0
+        if not self._outstanding.get(previous):
+            self._outstanding.pop(previous, None)
+            self._put(previous, None)
+
+    def _put(self, segment: int, line: Optional[bytes]) -> None:
+        with self._cond:
+            self._buffer.append((segment, line))
+            self._cond.notify()
+
+    def synced(self) -> asyncio.Future:
+        """
+        Future, который завершится, когда всё записанное к этому моменту окажется на диске.
+
+        Если записать не удалось, future завершается с OSError.
+        """
+        fut = asyncio.get_running_loop().create_future()
+        with self._cond:
+            self._waiters.append(fut)
+            self._cond.notify()
+        return fut
+
+    def _run(self) -> None:
+        # Открытые сегменты: текущий и старые, в которые ещё пишутся отметки о завершении
+        files: dict[int, BinaryIO] = {}
+        try:
+            while True:
+                with self._cond:
+                    while not self._buffer and not self._waiters and not self._closing:
+                        self._cond.wait()
+                    batch, self._buffer = self._buffer, []
+                    waiters, self._waiters = self._waiters, []
+                    closing = self._closing
+                error = None
+                try:
+                    touched = set()
+                    for segment, line in batch:
+                        if line is None:
+                            file = files.pop(segment, None)
+                            if file is not None:
+                                file.close()
+                            touched.discard(segment)
+                            self._segment_path(segment).unlink(missing_ok=True)
+                            continue
+                        file = files.get(segment)
+                        if file is None:
+                            file = files[segment] = self._open_segment(segment)
+                        file.write(line)
+                        touched.add(segment)
+                    for segment in touched:
+                        files[segment].flush()
+                        os.fsync(files[segment].fileno())
+                except OSError as e:
+                    logger.error(f"Журнал запросов: не удалось записать {self._dir}: {repr(e)}")
+                    error = e
+                for fut in waiters:
+                    fut.get_loop().call_soon_threadsafe(_settle, fut, error)
+                if closing and not batch:
+                    break
+        finally:
+            for file in files.values():
+                file.close()
+
+    def close(self) -> None:
+        """Дописывает накопленное и останавливает фоновый поток. Незавершённые запросы останутся в журнале."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
@@ -0,0 +1,225 @@
+"""
+Проведение запроса к внешнему API через лимитер - общее для роутера и моделирования (simulate.py):
+- Поиск API по URL, методу и x-identifier-extra
+- Кэш, совмещение одинаковых запросов, отказ по очереди и RPD, постановка в очередь и ожидание ответа
+- Срок запроса (x-deadline) и отмена при уходе клиента
+"""
+import asyncio
+import math
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from logger import setup_logger
+from models.api import Item
+from models.proxy_request import ProxyRequest
+from services.clock import Clock
+
+logger = setup_logger(__name__)
+
+# Значения x-deadline больше этого считаются unix timestamp, а не количеством секунд
+_TIMESTAMP_THRESHOLD = 1e9
+
+# Нестандартный статус "клиент закрыл соединение": ответ всё равно никто не получит
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def _watch_disconnect(request: Request, fut: asyncio.Future) -> None:
+    """
+    Отменяет future запроса, если клиент закрыл соединение, пока запрос ждёт ответа.
+
+    Слушать канал ASGI можно только после того, как тело запроса прочитано,
+    иначе слушатель заберёт его части у worker.
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            if not fut.done():
+                fut.cancel()
+            return
+
+
+async def _wait_response(
+    request: Request,
+    fut: asyncio.Future,
+    req: ProxyRequest,
+    deadline: Optional[float],
+    watch: bool,
+    clock: Clock
+):
+    """
+    Ждёт ответ на запрос до срока или до ухода клиента.
+
+    Args:
+        request: Входящий запрос
+        fut: Future с ответом внешнего API
+        req: Запрос, который отправит worker (для совмещённых - общий), по нему видно, ушёл ли он к внешнему API
+        deadline: Срок запроса (unix timestamp) или None
+        watch: Слушать уход клиента (тело запроса уже прочитано)
+        clock: Часы API, по которым задан срок
+    """
+    # Если клиент уйдёт, future отменится, и worker снимет запрос с очереди, не тратя на него лимиты
+    disconnect = asyncio.create_task(_watch_disconnect(request, fut)) if watch else None
+    try:
+        if deadline is None:
+            return await fut
+        # По истечении срока future тоже отменяется
+        return await asyncio.wait_for(fut, max(0.0, deadline - clock.time()))
+    except asyncio.TimeoutError:
+        if req.sent:
+            # Запрос уже передан внешнему API и его единица RPD потрачена, не дождались только ответа
+            return JSONResponse(status_code=504, content={"msg": "Срок запроса истёк до ответа внешнего API"})
+        return JSONResponse(status_code=504, content={"msg": "Срок запроса истёк до отправки"})
+    except asyncio.CancelledError:
+        if disconnect is None or not disconnect.done():
+            raise
+        logger.info("Клиент закрыл соединение, запрос отменён: %s, %s", request.method, request.url.path)
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    finally:
+        if disconnect is not None:
+            disconnect.cancel()
+
+
+def _parse_deadline(value: Optional[str], now: float) -> Optional[float]:
+    """Переводит x-deadline (секунды от текущего момента или unix timestamp) в unix timestamp."""
+    if value is None:
+        return None
+    try:
+        deadline = float(value)
+    except ValueError:
+        logger.warning(f'Deadline have to be number, got {value=}')
+        return None
+    return deadline if deadline > _TIMESTAMP_THRESHOLD else now + deadline
+
+
+def _retry_after(seconds: float) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def resolve_api(api_manager, url: str, method: str, headers: dict):
+    """
+    Находит API запроса по URL, методу и заголовку x-identifier-extra.
+
+    Заголовки лимитера (Host, x-identifier-extra) убираются из headers.
+
+    Returns:
+        API или None, если подходящего идентификатора нет
+    """
+    # Host лимитера не должен уходить во внешний API: aiohttp подставит нужный сам
+    headers.pop('host', None)
+    ide_extra = headers.pop('x-identifier-extra', "")
+    resolved = api_manager.get_identifier_matcher().resolve(url, method, ide_extra)
+    return None if resolved is None else resolved[1]
+
+
+async def submit_request(api, url: str, method: str, headers: dict, params: list, data, request: Optional[Request] = None):
+    """
+    Проводит запрос через кэш, совмещение, проверку очереди и RPD, ставит его в очередь API и ждёт ответ.
+
+    Args:
+        api: API, к которому относится запрос
+        url: URL запроса к внешнему API
+        method: HTTP метод
+        headers: Заголовки запроса, заголовки лимитера (x-priority, x-client-id, x-deadline) из них убираются
+        params: Параметры запроса, список пар
+        data: Тело запроса: None, bytes или поток
+        request: Входящий запрос, уход клиента которого отменяет запрос, или None
+
+    Returns:
+        Ответ внешнего API или ответ лимитера об отказе
+    """
+    # Обрабатываем приоритет из заголовка
+    priority = headers.pop('x-priority', 0)
+    try:
+        priority = int(priority)
+    except:
+        logger.warning(f'Priority have to be int-like string, got {priority=}')
+        priority = 0
+    
+    # Клиент лимитера: между клиентами очередь и квоты делятся по настройкам идентификатора
+    tenant = headers.pop('x-client-id', "")
+    
+    # Срок ожидания: заданный клиентом и не больше max_wait идентификатора
+    now = api.clock.time()
+    deadline = api.request_deadline(_parse_deadline(headers.pop('x-deadline', None), now), now)
+    
+    # Клиент долговечного API может не ждать ответа: запрос будет выполнен и после перезапуска лимитера
+    detached = headers.pop('x-async', '').lower() in ('1', 'true')
+    
+    # Формируем данные запроса без повторной валидации: URL проверен при поиске идентификатора
+    req = ProxyRequest(url, method, headers, params, data, deadline, api.clock.monotonic())
+    watch = request is not None
+    detached = detached and api.journal is not None and req.replayable
+    
+    # Свежий ответ из кэша отдаётся без очереди и без лимитов
+    cached = api.cached_response(req, now)
+    if cached is not None:
+        return cached
+    
+    # Такой же запрос уже ждёт в очереди или в полёте: ответ будет общий, лимиты не тратятся
+    flight_key = None if detached else api.flight_key(req)
+    if flight_key is not None:
+        joined = api.join_flight(flight_key, deadline)
+        if joined is not None:
+            waiter, shared = joined
+            try:
+                return await _wait_response(request, waiter, shared, deadline, watch, api.clock)
+            finally:
+                api.leave_flight(flight_key, waiter)
+    
+    # Запрос, который не дождётся отправки, отклоняется сразу, не занимая очередь и RPD
+    retry_after = api.admit(deadline, now)
+    if retry_after is not None:
+        api.metrics.rejected["shed"] += 1
+        return JSONResponse(
+            status_code=503,
+            content={"msg": "Очередь переполнена, запрос не будет отправлен вовремя"},
+            headers=_retry_after(retry_after)
+        )
+    
+    try:
+        reserved = await api.reserve_daily(tenant)
+    except Exception as e:
+        logger.error(f"Хранилище состояния лимитов недоступно: {repr(e)}")
+        return JSONResponse(status_code=503, content={"msg": "Хранилище состояния лимитов недоступно"})
+    if not reserved:
+        api.metrics.rejected["rpd"] += 1
+        reset = api.quota.expires(now) - now
+        return JSONResponse(
+            status_code=429,
+            content={"msg": "Достигнут лимит запросов в сутки"},
+            headers=_retry_after(reset) if math.isfinite(reset) else None
+        )
+    
+    fut = asyncio.Future()
+    item = Item(-priority, (fut, req), tenant)
+    api.journal_item(item, detached)
+    if detached:
+        # Подтверждение - после того как запрос записан в журнал на диске
+        api.queue.put_nowait(item)
+        try:
+            await api.journal.synced()
+        except OSError:
+            if not req.sent:
+                # Запрос не на диске и не переживёт перезапуск: он снимается с очереди, клиент повторит его сам
+                fut.cancel()
+                api.refund_daily(tenant)
+                return JSONResponse(status_code=503, content={"msg": "Журнал запросов недоступен"})
+        return JSONResponse(status_code=202, content={"msg": "Запрос принят"})
+    if flight_key is not None:
+        # Ответ первого запроса получат все присоединившиеся, поэтому ждём его через собственный waiter
+        waiter = api.start_flight(flight_key, item)
+        api.queue.put_nowait(item)
+        try:
+            return await _wait_response(request, waiter, req, deadline, watch, api.clock)
+        finally:
+            api.leave_flight(flight_key, waiter)
+    
+    api.queue.put_nowait(item)
+    try:
+        return await _wait_response(request, fut, req, deadline, watch and req.replayable, api.clock)
+    finally:
+        if fut.cancelled() and not req.sent:
+            # Запрос ещё в очереди и не будет отправлен: его единица RPD сразу достаётся следующим
+            api.refund_daily(tenant)
@@ -1,22 +1,100 @@
+import asyncio
+
 import aiohttp
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 from logger import setup_logger
+from models.proxy_request import ProxyRequest
 
 logger = setup_logger(__name__)
 
+CHUNK_SIZE = 64 * 1024
+
+# Заголовки, которые относятся к конкретному соединению и не передаются дальше прокси
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade",
+}
+
+
+def filter_headers(headers) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
 
-async def make_request(req):
+async def make_request(
+    session: aiohttp.ClientSession,
+    req: ProxyRequest,
+    timeout: aiohttp.ClientTimeout,
+    stream: bool = True
+):
+    """
+    Выполняет запрос к внешнему API и возвращает ответ как есть, без разбора тела.
+
+    Сессии создаются с auto_decompress=False, поэтому тело (в том числе сжатое) пересылается байт в байт
+    вместе с Content-Encoding и Content-Length.
+
+    Args:
+        session: Сессия из пула для origin запроса
+        req: Запрос к внешнему API
+        timeout: Таймаут запроса
+        stream: Если True, тело пересылается клиенту по частям по мере получения,
+                иначе сначала читается целиком. Ответы 429 всегда читаются целиком,
+                чтобы их можно было отбросить при повторной отправке запроса
+
+    Returns:
+        Response с кодом, заголовками и телом ответа внешнего API
+    """
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.request(**req) as resp:
-                content = await resp.json()
-                filtered_headers = {
-                    k: v
-                    for k, v in resp.headers.items()
-                    if k.lower() not in {"content-length", "content-encoding", "transfer-encoding"}
-                }
-                r = JSONResponse(status_code=resp.status, content=content, headers=filtered_headers)
+        resp = await session.request(
+            req.method, req.url, headers=req.headers, params=req.params, data=req.data, timeout=timeout
+        )
     except Exception as e:
-        r = JSONResponse(content={"error": f"{type(e)} {str(e)}"})
-    return r
\ No newline at end of file
+        return JSONResponse(status_code=502, content={"error": f"{type(e)} {str(e)}"})
+
+    headers = filter_headers(resp.headers)
+
+    if not stream or resp.status == 429:
+        try:
+            body = await resp.read()
+        except Exception as e:
+            return JSONResponse(status_code=502, content={"error": f"{type(e)} {str(e)}"})
+        finally:
+            resp.release()
+        return Response(content=body, status_code=resp.status, headers=headers)
+
+    return StreamingResponse(_ResponseBody(resp), status_code=resp.status, headers=headers)
+
+
+class _ResponseBody:
+    """
+    Тело ответа частями фиксированного размера. Соединение возвращается в пул, когда тело прочитано,
+    при ошибке чтения или при закрытии (aclose) - в том числе если чтение так и не начиналось.
+    """
+
+    def __init__(self, resp: aiohttp.ClientResponse):
+        self._resp = resp
+        self._chunks = resp.content.iter_chunked(CHUNK_SIZE)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await self._chunks.__anext__()
+        except BaseException:
+            self._resp.release()
+            raise
+
+    async def aclose(self) -> None:
+        self._resp.release()
+
+
+def discard_response(response: Response) -> None:
+    """
+    Освобождает ответ, который никто не заберёт (клиент ушёл или истёк срок запроса).
+
+    Непрочитанное потоковое тело держит соединение с внешним API, поэтому оно закрывается явно.
+    """
+    body = getattr(response, "body_iterator", None)
+    if body is not None and hasattr(body, "aclose"):
+        asyncio.ensure_future(body.aclose())
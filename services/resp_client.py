@@ -0,0 +1,121 @@
+"""
+Минимальный клиент протокола Redis (RESP2) поверх asyncio-потоков:
+- Одно соединение, команды отправляются пачками (pipeline) за один round-trip
+- Подключение по URL вида redis://[:password@]host[:port][/db]
+- Без внешних зависимостей, подходит для Redis, Valkey, KeyDB и совместимых серверов
+"""
+import asyncio
+from typing import Any, List, Optional, Sequence
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул сервер (ответ вида -ERR ...)."""
+
+
+def encode_command(*args) -> bytes:
+    """Кодирует команду в массив bulk-строк RESP."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """
+    Читает один ответ RESP.
+
+    Returns:
+        bytes для строк, int для чисел, list для массивов, None для nil.
+        Ошибка сервера возвращается экземпляром RespError, а не выбрасывается,
+        чтобы не терять остальные ответы pipeline
+    """
+    line = await reader.readuntil(b"\r\n")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload
+    if kind == b"-":
+        return RespError(payload.decode(errors="replace"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"Неизвестный тип ответа: {line!r}")
+
+
+class RespClient:
+    """Соединение с Redis-совместимым сервером."""
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self._host = parsed.hostname or "127.0.0.1"
+        self._port = parsed.port or 6379
+        self._password = parsed.password
+        self._db = int(parsed.path.strip("/") or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+        setup = []
+        if self._password:
+            setup.append(("AUTH", self._password))
+        if self._db:
+            setup.append(("SELECT", self._db))
+        if setup:
+            for reply in await self._send(setup):
+                if isinstance(reply, RespError):
+                    raise reply
+
+    async def _send(self, commands: Sequence[Sequence]) -> List[Any]:
+        self._writer.write(b"".join(encode_command(*command) for command in commands))
+        await self._writer.drain()
+        return [await read_reply(self._reader) for _ in commands]
+
+    async def pipeline(self, commands: Sequence[Sequence]) -> List[Any]:
+        """
+        Отправляет команды одной пачкой и возвращает ответы в том же порядке.
+
+        При обрыве соединения оно закрывается, следующий вызов подключится заново.
+
+        Args:
+            commands: Команды, каждая - последовательность аргументов, например ("GET", "key")
+
+        Returns:
+            Ответы сервера, ошибки - экземплярами RespError
+        """
+        if self._writer is None:
+            await self._connect()
+        try:
+            return await self._send(commands)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            raise
+
+    async def execute(self, *command) -> Any:
+        """Выполняет одну команду, ошибка сервера выбрасывается как RespError."""
+        reply = (await self.pipeline([command]))[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    async def close(self) -> None:
+        """Закрывает соединение."""
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        self._reader = self._writer = None
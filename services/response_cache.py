@@ -0,0 +1,300 @@
+"""
+Кэш ответов внешних API перед очередью запросов:
+- Свежесть по Cache-Control (s-maxage, max-age, no-cache, no-store, private), Expires и Age,
+  без них - по cache_ttl идентификатора
+- Устаревший ответ с ETag или Last-Modified проверяется условным запросом (If-None-Match, If-Modified-Since),
+  ответ 304 обновляет запись без передачи тела
+- В памяти LRU с ограничением по суммарному размеру в байтах
+- Вытесненные из памяти записи могут попадать во второй уровень - кольцевой буфер в файле, отображённом в память.
+  Индекс второго уровня хранится в памяти процесса, после перезапуска кэш пуст
+"""
+import json
+import mmap
+import os
+import re
+import struct
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from fastapi.responses import Response
+from starlette.datastructures import Headers
+
+# Коды ответов, которые можно кэшировать (RFC 9110, 15.1)
+CACHEABLE_STATUSES = {200, 203, 204, 300, 301, 404, 410}
+
+_DIRECTIVE_RE = re.compile(r'([\w-]+)\s*(?:=\s*"?([^",]*)"?)?')
+
+# Заголовки ответа 304, которые не относятся к сохранённому телу
+_BODY_HEADERS = {b"content-length", b"content-encoding", b"content-type", b"transfer-encoding"}
+
+# Служебный объём записи сверх тела и заголовков, для учёта размера кэша
+_ENTRY_OVERHEAD = 200
+
+
+def parse_cache_control(value: Optional[str]) -> dict[str, str]:
+    """Разбирает Cache-Control в словарь директив: имя в нижнем регистре -> аргумент (пустая строка, если его нет)."""
+    if not value:
+        return {}
+    return {name.lower(): arg for name, arg in _DIRECTIVE_RE.findall(value)}
+
+
+class CachedResponse:
+    """Сохранённый ответ: код, сырые заголовки, тело и срок свежести."""
+
+    __slots__ = ("status", "headers", "body", "stored_at", "expires", "size")
+
+    def __init__(self, status: int, headers: list[tuple[bytes, bytes]], body: bytes, stored_at: float, expires: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+        self.expires = expires
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers) + _ENTRY_OVERHEAD
+
+    def header(self, name: bytes) -> Optional[str]:
+        for key, value in self.headers:
+            if key == name:
+                return value.decode("latin-1")
+        return None
+
+    def fresh(self, now: float) -> bool:
+        return now < self.expires
+
+    @property
+    def revalidatable(self) -> bool:
+        """Есть ли валидаторы для условного запроса."""
+        return self.header(b"etag") is not None or self.header(b"last-modified") is not None
+
+    def conditional_headers(self) -> dict[str, str]:
+        """Заголовки условного запроса для проверки устаревшей записи."""
+        headers = {}
+        etag = self.header(b"etag")
+        if etag is not None:
+            headers["if-none-match"] = etag
+        last_modified = self.header(b"last-modified")
+        if last_modified is not None:
+            headers["if-modified-since"] = last_modified
+        return headers
+
+    def to_response(self, now: float) -> Response:
+        """Ответ клиенту с заголовком Age."""
+        response = Response(content=self.body, status_code=self.status)
+        response.raw_headers = [(k, v) for k, v in self.headers if k != b"age"]
+        response.raw_headers.append((b"age", str(int(max(0.0, now - self.stored_at))).encode()))
+        return response
+
+    _HEADER = struct.Struct("<HddII")
+
+    def dump(self) -> bytes:
+        headers = json.dumps([(k.decode("latin-1"), v.decode("latin-1")) for k, v in self.headers]).encode()
+        return self._HEADER.pack(self.status, self.stored_at, self.expires, len(headers), len(self.body)) + headers + self.body
+
+    @classmethod
+    def load(cls, data: bytes) -> "CachedResponse":
+        status, stored_at, expires, headers_length, body_length = cls._HEADER.unpack_from(data)
+        start = cls._HEADER.size
+        headers = [(k.encode("latin-1"), v.encode("latin-1"))
+                   for k, v in json.loads(data[start:start + headers_length])]
+        body = data[start + headers_length:start + headers_length + body_length]
+        return cls(status, headers, body, stored_at, expires)
+
+
+def freshness(headers: Headers, now: float, default_ttl: float) -> Optional[float]:
+    """
+    Определяет, до какого момента ответ свеж.
+
+    Args:
+        headers: Заголовки ответа внешнего API
+        now: Момент получения ответа, unix timestamp
+        default_ttl: Время жизни ответа без указаний о свежести
+
+    Returns:
+        Момент окончания свежести (равный now - запись сразу требует проверки) или None, если ответ хранить нельзя
+    """
+    if "*" in headers.get("vary", ""):
+        return None
+    directives = parse_cache_control(headers.get("cache-control"))
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return now
+
+    age = 0.0
+    try:
+        age = float(headers.get("age", 0))
+    except ValueError:
+        pass
+
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name):
+            try:
+                return now + max(0.0, float(directives[name]) - age)
+            except ValueError:
+                return now
+
+    expires = headers.get("expires")
+    if expires is not None:
+        try:
+            return max(now, parsedate_to_datetime(expires).timestamp())
+        except (TypeError, ValueError):
+            # Некорректный Expires означает "уже устарел"
+            return now
+    return now + default_ttl
+
+
+class _DiskTier:
+    """Кольцевой буфер записей в файле, отображённом в память. Новые записи затирают самые старые."""
+
+    def __init__(self, path: str, size: int):
+        self._size = size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._position = 0
+        self._index: dict[object, tuple[int, int]] = {}
+        # Записи в порядке записи: (смещение, длина, ключ), слева - самые старые
+        self._order: deque = deque()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _forget_oldest(self) -> None:
+        offset, length, key = self._order.popleft()
+        if self._index.get(key) == (offset, length):
+            del self._index[key]
+
+    def put(self, key, data: bytes) -> None:
+        length = len(data)
+        if length > self._size:
+            return
+        if self._position + length > self._size:
+            # Хвост файла пропускается: записи в нём - самые старые, их проще отбросить
+            while self._order and self._order[0][0] >= self._position:
+                self._forget_oldest()
+            self._position = 0
+        end = self._position + length
+        while self._order and self._order[0][0] < end and self._order[0][0] >= self._position:
+            self._forget_oldest()
+        self._map[self._position:end] = data
+        self._index[key] = (self._position, length)
+        self._order.append((self._position, length, key))
+        self._position = end
+
+    def pop(self, key) -> Optional[bytes]:
+        location = self._index.pop(key, None)
+        if location is None:
+            return None
+        offset, length = location
+        return bytes(self._map[offset:offset + length])
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+class ResponseCache:
+    """LRU-кэш ответов с ограничением по байтам и опциональным вторым уровнем на диске."""
+
+    def __init__(self, max_bytes: int, disk_path: Optional[str] = None, disk_size: int = 0):
+        self._max_bytes = max_bytes
+        # Одна запись не должна вытеснять весь кэш
+        self._max_entry = max_bytes // 4
+        self._entries: OrderedDict[object, CachedResponse] = OrderedDict()
+        self._bytes = 0
+        self._disk = _DiskTier(disk_path, disk_size) if disk_path and disk_size > 0 else None
+        self.hits = self.misses = self.revalidated = self.disk_hits = 0
+
+    def get(self, key) -> Optional[CachedResponse]:
+        """Возвращает запись (возможно, устаревшую) и отмечает её как недавно использованную."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self._disk is not None:
+            data = self._disk.pop(key)
+            if data is not None:
+                self.disk_hits += 1
+                entry = CachedResponse.load(data)
+                self._store(key, entry)
+                return entry
+        return None
+
+    def store(self, key, response: Response, now: float, default_ttl: float, key_headers: list[str]) -> None:
+        """
+        Сохраняет прочитанный целиком ответ, если его разрешено кэшировать.
+
+        Args:
+            key: Ключ запроса
+            response: Ответ внешнего API
+            now: Момент получения ответа, unix timestamp
+            default_ttl: Время жизни ответа без указаний о свежести
+            key_headers: Заголовки запроса, входящие в ключ: ответ, зависящий (Vary) от других заголовков, не хранится
+        """
+        if response.status_code not in CACHEABLE_STATUSES or not hasattr(response, "body"):
+            return
+        vary = response.headers.get("vary")
+        if vary and any(name.strip().lower() not in key_headers for name in vary.split(",")):
+            return
+        expires = freshness(response.headers, now, default_ttl)
+        if expires is None:
+            return
+        entry = CachedResponse(response.status_code, list(response.raw_headers), response.body, now, expires)
+        if expires <= now and not entry.revalidatable:
+            # Такую запись пришлось бы каждый раз запрашивать заново целиком
+            return
+        if entry.size <= self._max_entry:
+            self._store(key, entry)
+
+    def refresh(self, key, entry: CachedResponse, not_modified: Response, now: float, default_ttl: float) -> CachedResponse:
+        """
+        Обновляет устаревшую запись по ответу 304 на условный запрос.
+
+        Args:
+            key: Ключ запроса
+            entry: Устаревшая запись, по которой был сделан условный запрос
+            not_modified: Ответ 304 внешнего API
+            now: Момент получения ответа, unix timestamp
+            default_ttl: Время жизни ответа без указаний о свежести
+
+        Returns:
+            Обновлённая запись с прежним телом
+        """
+        updated = {name for name, _ in not_modified.raw_headers if name not in _BODY_HEADERS}
+        headers = [(k, v) for k, v in entry.headers if k not in updated]
+        headers += [(k, v) for k, v in not_modified.raw_headers if k in updated]
+        expires = freshness(Headers(raw=headers), now, default_ttl)
+        refreshed = CachedResponse(entry.status, headers, entry.body, now, now if expires is None else expires)
+        self.revalidated += 1
+        if expires is not None:
+            self._store(key, refreshed)
+        return refreshed
+
+    def _store(self, key, entry: CachedResponse) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self._max_bytes:
+            old_key, old = self._entries.popitem(last=False)
+            self._bytes -= old.size
+            if self._disk is not None:
+                self._disk.put(old_key, old.dump())
+
+    def info(self) -> dict:
+        """Статистика кэша."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "disk_hits": self.disk_hits,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes,
+            "disk_entries": len(self._disk) if self._disk is not None else 0,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
@@ -0,0 +1,142 @@
+"""
+Очереди запросов идентификатора:
+- AgingQueue: по приоритету, ожидающие запросы постепенно повышаются в приоритете (aging_rate единиц в секунду),
+  при равном приоритете - в порядке поступления
+- FairQueue: взвешенное справедливое разделение (WFQ) между клиентами из заголовка x-client-id,
+  внутри клиента - как AgingQueue
+
+Обе очереди - asyncio.Queue с put/get за O(log n): ключ старения не меняется со временем
+(приоритет + rate * ожидание сравнивается так же, как приоритет - rate * момент постановки).
+Ключ запоминается в элементе, и requeue возвращает взятый элемент с прежним ключом.
+"""
+import asyncio
+import heapq
+import itertools
+
+from schemas import RateLimitModel
+from services.clock import SYSTEM_CLOCK, Clock
+
+
+class AgingQueue(asyncio.Queue):
+    """Очередь с приоритетом и старением для элементов Item (меньше priority - раньше)."""
+
+    def __init__(self, aging_rate: float = 0.0, clock: Clock = SYSTEM_CLOCK):
+        self._aging_rate = aging_rate
+        self._clock = clock
+        self._counter = itertools.count()
+        # Идёт requeue: ключ берётся из элемента, а не вычисляется заново
+        self._requeuing = False
+        super().__init__()
+
+    def _init(self, maxsize):
+        self._queue = []
+
+    def _key(self, item) -> tuple:
+        if self._requeuing and item.queue_key is not None:
+            return item.queue_key
+        # Item.priority - приоритет со знаком минус: ожидание на t секунд уменьшает его на aging_rate * t
+        item.queue_key = item.priority + self._aging_rate * self._clock.monotonic(), next(self._counter)
+        return item.queue_key
+
+    def requeue(self, item) -> None:
+        """
+        Возвращает в очередь взятый из неё элемент (повтор после 429 или ошибки хранилища).
+
+        Элемент сохраняет прежний ключ: накопленное ожидание и место среди запросов своего приоритета
+        не теряются, и повторяемый запрос не оказывается раз за разом позади более новых.
+        """
+        self._requeuing = True
+        try:
+            self.put_nowait(item)
+        finally:
+            self._requeuing = False
+
+    def _put(self, item):
+        heapq.heappush(self._queue, (*self._key(item), item))
+
+    def _get(self):
+        return heapq.heappop(self._queue)[-1]
+
+
+class _Tenant:
+    __slots__ = ("heap", "weight", "finish")
+
+    def __init__(self, weight: float):
+        self.heap = []
+        self.weight = weight
+        # Виртуальное время окончания обслуживания очередного запроса клиента
+        self.finish = 0.0
+
+
+class _FairHeap:
+    """Очереди клиентов и куча активных клиентов по виртуальному времени окончания."""
+
+    def __init__(self):
+        self.tenants: dict[str, _Tenant] = {}
+        self.active = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"<{self.size} items, {len(self.active)} active tenants>"
+
+
+class FairQueue(AgingQueue):
+    """
+    Взвешенная справедливая очередь между клиентами (Item.tenant).
+
+    Клиент с весом w получает долю отправок, пропорциональную w, пока у него есть запросы в очереди.
+    Простаивающий клиент не копит "кредит": при возвращении он начинает с текущего виртуального времени.
+    """
+
+    def __init__(
+        self,
+        aging_rate: float = 0.0,
+        weights: dict[str, float] = None,
+        default_weight: float = 1.0,
+        clock: Clock = SYSTEM_CLOCK
+    ):
+        self._weights = weights or {}
+        self._default_weight = default_weight
+        self._virtual_time = 0.0
+        super().__init__(aging_rate, clock)
+
+    def _init(self, maxsize):
+        self._queue = _FairHeap()
+
+    def _put(self, item):
+        fair = self._queue
+        tenant = fair.tenants.get(item.tenant)
+        if tenant is None:
+            tenant = fair.tenants[item.tenant] = _Tenant(self._weights.get(item.tenant, self._default_weight))
+        if not tenant.heap:
+            # Возвращённый запрос свою очередь уже отстоял: клиент не платит за него второй раз
+            tenant.finish = max(self._virtual_time, tenant.finish) + (0 if self._requeuing else 1 / tenant.weight)
+            heapq.heappush(fair.active, (tenant.finish, next(self._counter), item.tenant))
+        heapq.heappush(tenant.heap, (*self._key(item), item))
+        fair.size += 1
+
+    def _get(self):
+        fair = self._queue
+        finish, _, name = heapq.heappop(fair.active)
+        self._virtual_time = finish
+        tenant = fair.tenants[name]
+        item = heapq.heappop(tenant.heap)[-1]
+        fair.size -= 1
+        if tenant.heap:
+            tenant.finish = finish + 1 / tenant.weight
+            heapq.heappush(fair.active, (tenant.finish, next(self._counter), name))
+        elif name not in self._weights:
+            # Клиенты без настроек не накапливаются в памяти
+            del fair.tenants[name]
+        return item
+
+
+def build_queue(rate_limit: RateLimitModel, clock: Clock = SYSTEM_CLOCK) -> AgingQueue:
+    """Создаёт очередь запросов по конфигурации идентификатора."""
+    if rate_limit.fair_queuing:
+        weights = {name: tenant.weight for name, tenant in rate_limit.tenants.items()}
+        return FairQueue(rate_limit.aging_rate, weights, clock=clock)
+    return AgingQueue(rate_limit.aging_rate, clock)
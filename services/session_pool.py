@@ -0,0 +1,73 @@
+"""
+Пул HTTP-сессий к внешним API:
+- Одна aiohttp.ClientSession на origin (схема + хост + порт) и набор настроек соединения
+- Сессии живут всё время работы приложения и переиспользуют keep-alive соединения
+"""
+from urllib.parse import urlparse
+
+import aiohttp
+
+from logger import setup_logger
+from schemas import RateLimitModel
+
+logger = setup_logger(__name__)
+
+
+class SessionPool:
+    """Пул долгоживущих aiohttp-сессий, сгруппированных по origin внешнего API."""
+
+    def __init__(self):
+        self._sessions: dict[tuple, aiohttp.ClientSession] = {}
+
+    def get(self, url: str, settings: RateLimitModel) -> aiohttp.ClientSession:
+        """
+        Возвращает сессию для URL, создавая её при первом обращении.
+
+        Идентификаторы с одинаковыми настройками соединения к одному origin делят одну сессию,
+        а значит и один пул соединений.
+
+        Args:
+            url: URL запроса к внешнему API
+            settings: Настройки лимитов идентификатора, из которых берутся параметры соединения
+
+        Returns:
+            aiohttp.ClientSession для этого origin
+        """
+        parsed_url = urlparse(url)
+        key = (
+            f"{parsed_url.scheme}://{parsed_url.netloc}",
+            settings.connections_limit,
+            settings.keepalive_timeout,
+            settings.dns_cache_ttl,
+        )
+
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            session = self._create_session(settings)
+            self._sessions[key] = session
+            logger.info(f"Создана сессия для {key[0]}")
+        return session
+
+    @staticmethod
+    def _create_session(settings: RateLimitModel) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=settings.connections_limit,
+            keepalive_timeout=settings.keepalive_timeout,
+            ttl_dns_cache=settings.dns_cache_ttl,
+        )
+        # Cookies внешних API не должны перетекать между разными клиентами лимитера,
+        # а сжатые ответы пересылаются клиенту без распаковки. Поэтому Accept-Encoding
+        # отправляется только тот, что прислал сам клиент
+        return aiohttp.ClientSession(
+            connector=connector,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            auto_decompress=False,
+            skip_auto_headers=("Accept-Encoding",),
+        )
+
+    async def close(self) -> None:
+        """Закрывает все сессии пула."""
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
@@ -0,0 +1,261 @@
+"""
+Хранилища состояния лимитов:
+- LocalBackend: состояние в памяти процесса
+- SharedMemoryBackend: общий для процессов одной машины файл, отображённый в память (mmap),
+  изменения под файловой блокировкой. Позволяет запускать uvicorn с несколькими workers
+- RedisBackend: Redis-совместимый сервер, общий для нескольких машин.
+  Изменения - оптимистичные транзакции WATCH/MULTI/EXEC, повторяемые при конфликте
+
+Состояние - вектор чисел фиксированной длины по строковому ключу.
+Все изменения выполняются через transact: чтение, изменение и запись атомарны.
+"""
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+from typing import Callable, List, Optional, TypeVar
+
+from logger import setup_logger
+from schemas import SettingsModel
+from services.counter_store import CounterStore
+from services.resp_client import RespClient, RespError
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: общий файл состояния недоступен, остальные хранилища работают
+    fcntl = None
+
+logger = setup_logger(__name__)
+
+T = TypeVar("T")
+
+
+class StateBackend:
+    """
+    Хранилище векторов состояния по ключам.
+
+    lease_size - сколько разрешений (моментов отправки, единиц RPD) забирать за одно обращение к хранилищу.
+    Для удалённого хранилища больше 1, чтобы запросы не ждали round-trip каждый раз.
+    """
+
+    lease_size = 1
+
+    async def transact(
+        self,
+        key: str,
+        initial: List[float],
+        fn: Callable[[List[float]], T],
+        durable: bool = False
+    ) -> T:
+        """
+        Атомарно применяет fn к состоянию ключа.
+
+        Args:
+            key: Ключ состояния
+            initial: Начальное состояние, если ключа ещё нет или сохранённое состояние другой длины
+            fn: Изменяет состояние на месте, не меняя его длину, и возвращает результат транзакции
+            durable: Состояние должно пережить перезапуск (счётчики RPD)
+
+        Returns:
+            Результат fn
+        """
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Освобождает ресурсы хранилища."""
+
+
+class LocalBackend(StateBackend):
+    """
+    Состояние в памяти процесса.
+
+    С CounterStore durable-состояния восстанавливаются при создании и сохраняются на диск в фоне.
+    """
+
+    def __init__(self, store: Optional[CounterStore] = None):
+        self._store = store
+        self._states: dict[str, List[float]] = store.load() if store is not None else {}
+        if store is not None:
+            logger.info(f"Восстановлено сохранённых счётчиков: {len(self._states)}")
+
+    async def transact(self, key, initial, fn, durable=False):
+        state = self._states.get(key)
+        if state is None or len(state) != len(initial):
+            state = self._states[key] = list(initial)
+        result = fn(state)
+        if durable and self._store is not None:
+            self._store.save(key, state)
+        return result
+
+    async def close(self):
+        if self._store is not None:
+            await asyncio.to_thread(self._store.close)
+
+
+class SharedMemoryBackend(StateBackend):
+    """
+    Состояние в файле, отображённом в память всех процессов машины.
+
+    Раскладка файла:
+    - заголовок: magic, количество слотов каталога, смещение свободного места
+    - каталог: слоты (хэш ключа, смещение, длина вектора), открытая адресация по хэшу
+    - данные: векторы double, выделяются последовательно и не освобождаются
+
+    Все процессы должны открывать файл с одинаковыми slots и size.
+    Файл переживает перезапуск, поэтому отдельное сохранение durable-состояний не требуется.
+    """
+
+    MAGIC = 0x524C5354  # "RLST"
+    HEADER = struct.Struct("<QQQ")
+    SLOT = struct.Struct("<QQQ")
+
+    def __init__(self, path: str, size: int, slots: int = 4096):
+        if fcntl is None:
+            raise RuntimeError("Хранилище shared_memory поддерживается только на POSIX-системах")
+        self._path = path
+        self._size = size
+        self._slots = slots
+        self._data_start = self.HEADER.size + self.SLOT.size * slots
+        self._hashes: dict[str, int] = {}
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._locked():
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            magic, stored_slots, _ = self.HEADER.unpack_from(self._map, 0)
+            if magic != self.MAGIC:
+                self._map[:self._data_start] = bytes(self._data_start)
+                self.HEADER.pack_into(self._map, 0, self.MAGIC, slots, self._data_start)
+            else:
+                # Файл уже создан другим процессом: раскладка каталога берётся из него
+                self._slots = stored_slots
+                self._data_start = self.HEADER.size + self.SLOT.size * stored_slots
+        logger.info(f"Общее состояние лимитов: {path}")
+
+    def _locked(self):
+        return _FileLock(self._fd)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # 0 означает пустой слот каталога
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def _find_slot(self, key_hash: int) -> tuple[int, int, int]:
+        """Возвращает (позицию слота в каталоге, смещение, длину) для ключа; смещение 0 - ключа ещё нет."""
+        index = key_hash % self._slots
+        for _ in range(self._slots):
+            position = self.HEADER.size + index * self.SLOT.size
+            slot_hash, offset, length = self.SLOT.unpack_from(self._map, position)
+            if slot_hash == key_hash or slot_hash == 0:
+                return position, offset if slot_hash else 0, length
+            index = (index + 1) % self._slots
+        raise RuntimeError(f"Каталог общего состояния {self._path} заполнен")
+
+    def _allocate(self, length: int) -> int:
+        magic, slots, free = self.HEADER.unpack_from(self._map, 0)
+        if free + length * 8 > self._size:
+            raise RuntimeError(f"Недостаточно места в файле общего состояния {self._path}")
+        self.HEADER.pack_into(self._map, 0, magic, slots, free + length * 8)
+        return free
+
+    async def transact(self, key, initial, fn, durable=False):
+        key_hash = self._hashes.get(key) or self._hashes.setdefault(key, self._hash(key))
+        with self._locked():
+            position, offset, length = self._find_slot(key_hash)
+            if offset and length == len(initial):
+                state = list(struct.unpack_from(f"<{length}d", self._map, offset))
+            else:
+                # Новый ключ или изменился размер состояния (например, поменялись правила в конфиге)
+                state = list(initial)
+                length = len(state)
+                offset = self._allocate(length)
+                self.SLOT.pack_into(self._map, position, key_hash, offset, length)
+
+            result = fn(state)
+            struct.pack_into(f"<{length}d", self._map, offset, *state)
+            return result
+
+    async def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class RedisBackend(StateBackend):
+    """
+    Состояние на Redis-совместимом сервере, общее для всех экземпляров лимитера.
+
+    Вектор хранится строкой упакованных double под ключом prefix + key.
+    Правила вычисляются на стороне лимитера: значение читается под WATCH и записывается в MULTI/EXEC,
+    при изменении ключа другим экземпляром транзакция повторяется.
+    """
+
+    MAX_ATTEMPTS = 100
+
+    def __init__(self, url: str, prefix: str = "ratelimiter:", lease_size: int = 10):
+        self._client = RespClient(url)
+        self._prefix = prefix
+        self.lease_size = max(1, lease_size)
+        # WATCH действует на соединение целиком, поэтому транзакции одного процесса идут по очереди
+        self._lock = asyncio.Lock()
+        logger.info(f"Общее состояние лимитов: {url}")
+
+    async def transact(self, key, initial, fn, durable=False):
+        # Сохранность данных между перезапусками обеспечивает сам сервер (RDB/AOF)
+        name = self._prefix + key
+        async with self._lock:
+            for _ in range(self.MAX_ATTEMPTS):
+                _, raw = await self._client.pipeline([("WATCH", name), ("GET", name)])
+                if isinstance(raw, RespError):
+                    raise raw
+                if raw is not None and len(raw) == 8 * len(initial):
+                    state = list(struct.unpack(f"<{len(initial)}d", raw))
+                else:
+                    state = list(initial)
+
+                result = fn(state)
+                packed = struct.pack(f"<{len(state)}d", *state)
+                if packed == raw:
+                    # Транзакция ничего не изменила (например, только расчёт задержки)
+                    await self._client.execute("UNWATCH")
+                    return result
+
+                replies = await self._client.pipeline([("MULTI",), ("SET", name, packed), ("EXEC",)])
+                if isinstance(replies[-1], RespError):
+                    raise replies[-1]
+                if replies[-1] is not None:
+                    return result
+            raise RuntimeError(f"Не удалось изменить состояние {name}: слишком много конфликтов")
+
+    async def close(self):
+        await self._client.close()
+
+
+class _FileLock:
+    """Эксклюзивная блокировка файла на время транзакции."""
+
+    def __init__(self, fd: int):
+        self._fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def create_state_backend(settings: SettingsModel, counter_store: Optional[CounterStore] = None) -> StateBackend:
+    """
+    Создаёт хранилище состояния лимитов по общим настройкам.
+
+    Args:
+        settings: Общие настройки лимитера
+        counter_store: Файл сохранённых счётчиков для хранилища в памяти процесса
+    """
+    if settings.state_backend == "shared_memory":
+        return SharedMemoryBackend(settings.shared_state_path, settings.shared_state_size)
+    if settings.state_backend == "redis":
+        return RedisBackend(settings.redis_url, settings.redis_prefix, settings.lease_size)
+    return LocalBackend(counter_store)
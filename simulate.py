@@ -0,0 +1,386 @@
+"""
+Моделирование нагрузки на лимитер в виртуальном времени - для оценки новых записей apis.json до выкладки.
+
+Запросы проходят через APIManager и ту же обработку, что и запросы к сервису (кэш, совмещение, отказ
+по очереди и RPD, приоритеты, сроки, квоты клиентов), но по виртуальным часам (services.clock.VirtualClock):
+паузы между запросами, ответы внешнего API и смена суток для RPD не занимают реального времени.
+Реальное время уходит только на обработку самих запросов - столько же, сколько у сервиса (тысячи в секунду).
+Внешний API заменяется моделью с заданной задержкой ответа и, если нужно, собственными лимитами (429).
+
+Запросы берутся из трассы или генерируются (пуассоновский поток с заданной частотой).
+Трасса - NDJSON в формате запросов /batch с полем at - секунды от начала моделирования, по возрастанию at:
+{"at": 0.5, "url": "https://api.example.com/v1/items", "headers": {"x-priority": "1", "x-client-id": "a"}}
+
+Отчёт - JSON в stdout (или в файл --output), краткая сводка - в stderr. По каждому API: отправлено и отклонено
+по причинам, коды ответов, ожидание в очереди (p50/p90/p99/p999/max), наибольшая глубина очереди
+и расход RPD по периодам сброса. Код возврата 1, если при rolling_24h за какие-то 24 часа отправлено больше RPD.
+
+Запуск:
+    python simulate.py apis.json --rate https://api.example.com/v1/items=2 --duration 86400
+    python simulate.py apis.json --trace recorded.ndjson --latency 0.3 --start 2026-01-01T00:00:00
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import math
+import random
+import sys
+import time
+from array import array
+from collections import Counter, deque
+from datetime import datetime
+from typing import Iterator, Optional
+
+from models.api import API
+from models.api_manager import APIManager
+from schemas import SettingsModel
+from services.clock import VirtualClock
+from services.quota_schedules import RollingSchedule
+from services.request_submission import resolve_api, submit_request
+from services.state_backends import LocalBackend
+
+# Заголовок, по которому модель внешнего API узнаёт запрос, чтобы посчитать его ожидание в очереди
+SIMULATION_ID_HEADER = "x-simulation-id"
+
+
+class _SimulatedResponse:
+    """Ответ модели внешнего API с интерфейсом aiohttp.ClientResponse, который использует make_request."""
+
+    __slots__ = ("status", "headers")
+
+    def __init__(self, status: int, headers: dict):
+        self.status = status
+        self.headers = headers
+
+    async def read(self) -> bytes:
+        return b""
+
+    def release(self) -> None:
+        pass
+
+
+class SimulatedUpstream:
+    """
+    Модель внешних API: отвечает 200 через latency секунд.
+
+    Заменяет пул сессий: API получает её вместо сессии и вызывает request, как у aiohttp.ClientSession.
+    С limits отвечает 429 с Retry-After на запросы сверх limit за любые period секунд к URL с заданным префиксом.
+    """
+
+    def __init__(self, clock: VirtualClock, latency: float, limits: dict[str, tuple[int, float]] = None):
+        self._clock = clock
+        self._latency = latency
+        self._limits = limits or {}
+        self._windows = {prefix: deque() for prefix in self._limits}
+        # Момент первой отправки запроса (монотонное время) по SIMULATION_ID_HEADER
+        self.received: dict[str, float] = {}
+
+    def get(self, url: str, rate_limit) -> "SimulatedUpstream":
+        return self
+
+    def _allowed(self, url: str, now: float) -> bool:
+        for prefix, (limit, period) in self._limits.items():
+            if not url.startswith(prefix):
+                continue
+            window = self._windows[prefix]
+            while window and window[0] <= now - period:
+                window.popleft()
+            if len(window) >= limit:
+                return False
+            window.append(now)
+        return True
+
+    async def request(self, method, url, headers=None, params=None, data=None, timeout=None):
+        now = self._clock.monotonic()
+        request_id = headers.get(SIMULATION_ID_HEADER) if headers else None
+        if request_id is not None:
+            self.received.setdefault(request_id, now)
+        if not self._allowed(url, now):
+            return _SimulatedResponse(429, {"Retry-After": "1"})
+        if self._latency > 0:
+            await asyncio.sleep(self._latency)
+        return _SimulatedResponse(200, {})
+
+    async def close(self) -> None:
+        pass
+
+
+class _APIStats:
+    """Результаты моделирования одного API."""
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = Counter()
+        self.max_depth = 0
+        # Ожидание в очереди отправленных запросов, секунды
+        self.waits = array("d")
+        # Моменты отправки и отказов по RPD (unix timestamp) для расхода квоты по периодам
+        self.sent_at = array("d")
+        self.rejected_at = array("d")
+
+
+def _percentiles(values: array) -> dict:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "p999": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 6)
+
+    return {"p50": rank(0.5), "p90": rank(0.9), "p99": rank(0.99), "p999": rank(0.999),
+            "max": round(ordered[-1], 6), "mean": round(sum(ordered) / len(ordered), 6)}
+
+
+def _iso(timestamp: float) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds") if math.isfinite(timestamp) else None
+
+
+def _quota_usage(api: API, stats: _APIStats) -> dict:
+    """
+    Отправленные запросы и отказы по RPD по периодам сброса RPD идентификатора.
+
+    Запросы относятся к периоду по моменту отправки, как их считает внешний API: учтённый в RPD до сброса,
+    но отправленный после него запрос попадает в следующий период.
+    """
+    periods: dict[float, list[int]] = {}
+    for position, times in enumerate((stats.sent_at, stats.rejected_at)):
+        for at in times:
+            periods.setdefault(api.quota.expires(at), [0, 0])[position] += 1
+    usage = {
+        "RPD": api.rpd,
+        "rpd_reset": api.rate_limit.rpd_reset,
+        "periods": [
+            {"until": _iso(until), "sent": sent, "rejected_rpd": rejected}
+            for until, (sent, rejected) in sorted(periods.items())
+        ],
+    }
+    if isinstance(api.quota, RollingSchedule):
+        # Скользящий период не делится на календарные: важен наибольший расход за любые сутки
+        ordered, start, peak = sorted(stats.sent_at), 0, 0
+        for end, at in enumerate(ordered):
+            while at - ordered[start] >= 86400:
+                start += 1
+            peak = max(peak, end - start + 1)
+        usage["max_sent_24h"] = peak
+        # Внешний API с тем же RPD не должен увидеть больше RPD запросов ни за какие 24 часа
+        usage["rpd_exceeded"] = api.rpd >= 0 and peak > api.rpd
+    return usage
+
+
+class Simulation:
+    """Прогон потока запросов через APIManager по виртуальным часам."""
+
+    def __init__(
+        self,
+        data: dict,
+        clock: VirtualClock,
+        latency: float = 0.0,
+        upstream_limits: dict[str, tuple[int, float]] = None
+    ):
+        """
+        Args:
+            data: Содержимое apis.json
+            clock: Виртуальные часы, в event loop которых выполняется run
+            latency: Задержка ответа внешнего API, секунды
+            upstream_limits: Собственные лимиты внешнего API: префикс URL -> (limit, period)
+        """
+        self.clock = clock
+        self.upstream = SimulatedUpstream(clock, latency, upstream_limits)
+        self._data = data
+        self.api_manager: Optional[APIManager] = None
+        self.stats: dict[str, _APIStats] = {}
+        self.unmatched = 0
+
+    def _start(self) -> None:
+        # Состояние лимитов - в памяти и с нуля, без журнала и дискового кэша: моделирование не трогает файлы сервиса
+        settings = SettingsModel(**{**self._data.get("settings", {}), "cache_disk_path": None})
+        sources = []
+        for cfg in self._data["sources"]:
+            # Тело ответа не моделируется, поэтому и передавать его по частям незачем
+            rate_limit = {**cfg.get("rate_limit", {}), "stream_response": False}
+            sources.append({**cfg, "rate_limit": rate_limit})
+        self.api_manager = APIManager(
+            sources, asyncio.Event(), self.upstream, LocalBackend(), settings, clock=self.clock
+        )
+        self.stats = {identifier: _APIStats() for identifier in self.api_manager.get_all_apis()}
+        self.api_manager.start()
+
+    async def _request(self, spec: dict, request_id: str) -> None:
+        url = spec["url"]
+        method = str(spec.get("method", "GET")).upper()
+        headers = {str(k).lower(): str(v) for k, v in spec.get("headers", {}).items()}
+        headers[SIMULATION_ID_HEADER] = request_id
+        api = resolve_api(self.api_manager, url, method, headers)
+        if api is None:
+            self.unmatched += 1
+            return
+        stats = self.stats[api.identifier]
+        stats.requests += 1
+        stats.max_depth = max(stats.max_depth, api.queue.qsize() + 1)
+        params = spec.get("params", [])
+        params = [(str(k), str(v)) for k, v in (params.items() if isinstance(params, dict) else params)]
+        submitted = self.clock.monotonic()
+
+        response = await submit_request(api, url, method, headers, params, None)
+
+        stats.statuses[response.status_code] += 1
+        sent = self.upstream.received.pop(request_id, None)
+        if sent is not None:
+            stats.waits.append(sent - submitted)
+            stats.sent_at.append(self.clock.time() - self.clock.monotonic() + sent)
+        elif response.status_code == 429:
+            # Не отправленный запрос с 429 - отказ лимитера по RPD идентификатора или квоте клиента
+            stats.rejected_at.append(self.clock.time())
+
+    async def run(self, arrivals: Iterator[tuple[float, dict]]) -> dict:
+        """
+        Отправляет запросы в заданные моменты и ждёт ответа на все.
+
+        Args:
+            arrivals: Пары (секунды от начала моделирования, запрос в формате /batch) по возрастанию времени
+
+        Returns:
+            Отчёт моделирования
+        """
+        started = time.perf_counter()
+        start = self.clock.time()
+        self._start()
+        pending: set[asyncio.Task] = set()
+        count = 0
+        try:
+            for at, spec in arrivals:
+                delay = at - self.clock.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(self._request(spec, str(count)))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                count += 1
+            while pending:
+                await asyncio.gather(*pending)
+        finally:
+            await self.api_manager.stop()
+        real = time.perf_counter() - started
+
+        apis = {}
+        for identifier, api in self.api_manager.get_all_apis().items():
+            stats = self.stats[identifier]
+            if not stats.requests:
+                continue
+            apis[identifier] = {
+                "requests": stats.requests,
+                "statuses": {str(status): n for status, n in sorted(stats.statuses.items())},
+                "sent": api.metrics.sent,
+                "upstream_429": api.metrics.throttled,
+                "rejected": dict(api.metrics.rejected),
+                "configured_rate": round(1 / api.limiter.gap, 6) if api.limiter.gap > 0 else None,
+                "queue_wait": _percentiles(stats.waits),
+                "max_queue_depth": stats.max_depth,
+                "quota": _quota_usage(api, stats),
+            }
+        return {
+            "start": _iso(start),
+            "simulated_seconds": round(self.clock.monotonic(), 3),
+            "real_seconds": round(real, 3),
+            "requests": count,
+            "requests_per_real_second": round(count / real) if real > 0 else None,
+            "unmatched": self.unmatched,
+            "apis": apis,
+        }
+
+
+def read_trace(path: str) -> Iterator[tuple[float, dict]]:
+    """Читает трассу NDJSON построчно: в памяти не держится."""
+    with open(path, "r", encoding="utf8") as f:
+        for line in f:
+            if line.strip():
+                spec = json.loads(line)
+                yield float(spec.pop("at")), spec
+
+
+def poisson_arrivals(url: str, rate: float, duration: float, rng: random.Random) -> Iterator[tuple[float, dict]]:
+    """Пуассоновский поток GET-запросов к url со средней частотой rate в секунду."""
+    at = rng.expovariate(rate)
+    while at < duration:
+        yield at, {"url": url}
+        at += rng.expovariate(rate)
+
+
+def _parse_rate(value: str) -> tuple[str, float]:
+    url, _, rate = value.rpartition("=")
+    return url, float(rate)
+
+
+def _parse_limit(value: str) -> tuple[str, tuple[int, float]]:
+    prefix, _, spec = value.rpartition("=")
+    limit, _, period = spec.partition("/")
+    return prefix, (int(limit), float(period or 1))
+
+
+def summary(report: dict) -> str:
+    lines = [
+        f"{report['requests']} запросов, {report['simulated_seconds']} с виртуального времени"
+        f" за {report['real_seconds']} с, без подходящего API: {report['unmatched']}"
+    ]
+    for identifier, result in report["apis"].items():
+        wait = result["queue_wait"]
+        lines.append(
+            f"{identifier}: отправлено {result['sent']} из {result['requests']}, отклонено {result['rejected']},"
+            f" 429 от API: {result['upstream_429']}, ожидание p50/p99/max: {wait['p50']} / {wait['p99']}"
+            f" / {wait['max']} с, очередь до {result['max_queue_depth']}"
+        )
+        if result["quota"].get("rpd_exceeded"):
+            lines.append(
+                f"{identifier}: за 24 часа отправлено {result['quota']['max_sent_24h']}"
+                f" запросов при RPD {result['quota']['RPD']}"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Моделирование нагрузки на лимитер в виртуальном времени")
+    parser.add_argument("config", help="apis.json")
+    parser.add_argument("--trace", help="трасса запросов NDJSON")
+    parser.add_argument("--rate", action="append", default=[], type=_parse_rate,
+                        help="синтетический поток: URL=запросов в секунду, можно повторять")
+    parser.add_argument("--duration", type=float, default=3600, help="длительность синтетического потока, секунды")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", help="начало моделирования, ISO 8601. По умолчанию - текущее время")
+    parser.add_argument("--latency", type=float, default=0.1, help="задержка ответа внешнего API, секунды")
+    parser.add_argument("--upstream-limit", action="append", default=[], type=_parse_limit,
+                        help="лимит самого внешнего API: префикс URL=N/period, сверх него - 429")
+    parser.add_argument("--output", help="файл для JSON вместо stdout")
+    args = parser.parse_args()
+    if not args.trace and not args.rate:
+        parser.error("нужна трасса --trace или хотя бы один поток --rate")
+
+    # Сообщения на каждый запрос при моделировании не нужны
+    logging.disable(logging.INFO)
+    with open(args.config, "r", encoding="utf8") as f:
+        data = json.load(f)
+
+    rng = random.Random(args.seed)
+    streams = [poisson_arrivals(url, rate, args.duration, rng) for url, rate in args.rate]
+    if args.trace:
+        streams.append(read_trace(args.trace))
+    arrivals = heapq.merge(*streams, key=lambda arrival: arrival[0])
+
+    clock = VirtualClock(datetime.fromisoformat(args.start).timestamp() if args.start else None)
+    simulation = Simulation(data, clock, args.latency, dict(args.upstream_limit))
+    report = clock.run(simulation.run(arrivals))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    print(summary(report), file=sys.stderr)
+    exceeded = any(result["quota"].get("rpd_exceeded") for result in report["apis"].values())
+    sys.exit(1 if exceeded else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+"""
+Воспроизводимый замер лимитера и проверка соблюдения лимитов.
+
+Запускает подменный внешний API (tests.stub_upstream) и лимитер (uvicorn main:app) отдельными процессами
+на свободных портах со своим apis.json во временном каталоге, затем по очереди:
+- overhead: нагрузка с открытым циклом (запросы уходят по расписанию, не дожидаясь ответов): в каждый
+  запланированный момент уходит пара запросов - напрямую и через лимитер. Задержка считается от запланированного
+  момента, поэтому отставание генератора или очереди не скрывается. Накладные расходы - перцентили p50/p99/p999
+  разницы задержек внутри пары: оба запроса пары прошли через одну и ту же нагрузку на машину
+- throughput: сколько запросов в секунду лимитер проводит при concurrency одновременных клиентах
+- compliance: нагрузка в 3 раза выше настроенной частоты; проверяется, что подменный API не ответил ни одного 429
+  и по его журналу ни в каком окне period не пришло больше limit запросов. Окно короче period
+  на --compliance-tolerance (допуск на сеть, тот же у лимита подменного API). Минимальный интервал - для справки
+- idle_cpu: процессорное время лимитера без нагрузки
+- memory: прирост RSS лимитера на один запрос, ждущий в очереди (запросы ставятся через /batch)
+
+Результат - JSON в stdout (или в файл --output), краткая сводка - в stderr.
+Код возврата 1, если проверка лимитов не пройдена.
+RSS и процессорное время читаются из /proc, на других системах они будут null.
+
+Запуск: python -m tests.benchmark [--quick] [--output result.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: list[float]) -> dict:
+    """p50/p99/p999 и максимум в миллисекундах (nearest rank)."""
+    if not values:
+        return {"count": 0, "p50": None, "p99": None, "p999": None, "max": None}
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"count": len(ordered), "p50": rank(0.5), "p99": rank(0.99), "p999": rank(0.999),
+            "max": round(ordered[-1] * 1000, 3)}
+
+
+def cpu_seconds(pid: int):
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime и stime - 14 и 15 поля, считая от pid
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_bytes(pid: int):
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.dir = Path(tempfile.mkdtemp(prefix="ratelimiter-bench-"))
+        self.stub_port = free_port()
+        self.limiter_port = free_port()
+        self.stub = f"http://127.0.0.1:{self.stub_port}"
+        self.limiter = f"http://127.0.0.1:{self.limiter_port}"
+        self.processes: list[subprocess.Popen] = []
+        self.limiter_process = None
+
+    # --- процессы ---
+
+    def config(self) -> dict:
+        args = self.args
+        return {
+            "settings": {"persist_counters": False, "journal_path": str(self.dir / "journal")},
+            "sources": [
+                {"identifier": {"url": f"{self.stub}/overhead"},
+                 "rate_limit": {"interval": 0.0001, "RPD": -1}},
+                {"identifier": {"url": f"{self.stub}/compliance"},
+                 "rate_limit": {"interval": args.compliance_period / args.compliance_limit, "RPD": -1,
+                                "limits": [{"type": "sliding_window_log", "limit": args.compliance_limit,
+                                            "period": args.compliance_period}]}},
+                {"identifier": {"url": f"{self.stub}/memory"},
+                 "rate_limit": {"interval": 3600, "RPD": -1}},
+            ],
+        }
+
+    def spawn(self, cmd: list[str], name: str, env: dict = None) -> subprocess.Popen:
+        log = open(self.dir / f"{name}.log", "wb")
+        process = subprocess.Popen(cmd, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+                                   env={**os.environ, **(env or {})})
+        log.close()
+        self.processes.append(process)
+        return process
+
+    async def wait_ready(self, session: aiohttp.ClientSession, url: str, process: subprocess.Popen, name: str):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+        log = (self.dir / f"{name}.log").read_text(errors="replace")
+        raise RuntimeError(f"{name} не запустился:\n{log[-2000:]}")
+
+    async def start(self, session: aiohttp.ClientSession):
+        (self.dir / "apis.json").write_text(json.dumps(self.config()))
+        limit = f"compliance={self.args.compliance_limit}/{self.args.compliance_period}"
+        stub = self.spawn([sys.executable, "-m", "tests.stub_upstream", "--port", str(self.stub_port),
+                           "--latency", str(self.args.latency), "--limit", limit,
+                           "--tolerance", str(self.args.compliance_tolerance)], "stub")
+        self.limiter_process = self.spawn(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.limiter_port),
+             "--log-level", "warning", "--no-access-log"],
+            "limiter",
+            {"RATELIMITER_CONFIG": str(self.dir / "apis.json"), "RATELIMITER_LOG_LEVEL": "WARNING"},
+        )
+        await self.wait_ready(session, f"{self.stub}/_stats", stub, "stub")
+        await self.wait_ready(session, f"{self.limiter}/admin/get_apis", self.limiter_process, "limiter")
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def proxied(self, url: str) -> str:
+        return f"{self.limiter}/{url}"
+
+    # --- генераторы нагрузки ---
+
+    @staticmethod
+    async def open_loop(session: aiohttp.ClientSession, url: str, rate: float, duration: float) -> dict:
+        """
+        Отправляет запросы с частотой rate в течение duration, не дожидаясь ответов.
+
+        Returns:
+            Задержки от запланированного момента отправки, число ошибок и отставание генератора
+        """
+        latencies, errors, lag = [], 0, 0.0
+
+        async def fire(scheduled: float, i: int):
+            nonlocal errors
+            try:
+                async with session.get(url, params={"i": i}) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        errors += 1
+                        return
+            except aiohttp.ClientError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - scheduled)
+
+        tasks = []
+        started = time.perf_counter()
+        for i in range(int(rate * duration)):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+            tasks.append(asyncio.create_task(fire(scheduled, i)))
+        await asyncio.gather(*tasks)
+        return {"latency_ms": percentiles(latencies), "errors": errors, "generator_lag_ms": round(lag * 1000, 3)}
+
+    @staticmethod
+    async def paired_loop(session: aiohttp.ClientSession, direct_url: str, proxied_url: str, rate: float,
+                          duration: float) -> dict:
+        """
+        Открытый цикл, как open_loop, но в каждый момент расписания уходят два запроса: напрямую и через лимитер.
+
+        Returns:
+            Задержки обоих путей, разница задержек внутри пары, число ошибок и отставание генератора
+        """
+        direct, proxied, differences, errors, lag = [], [], [], 0, 0.0
+
+        async def timed(url: str, scheduled: float, i: int) -> Optional[float]:
+            nonlocal errors
+            try:
+                async with session.get(url, params={"i": i}) as resp:
+                    await resp.read()
+                    if resp.status == 200:
+                        return time.perf_counter() - scheduled
+            except aiohttp.ClientError:
+                pass
+            errors += 1
+            return None
+
+        async def fire(scheduled: float, i: int):
+            pair = await asyncio.gather(timed(direct_url, scheduled, i), timed(proxied_url, scheduled, i))
+            if pair[0] is not None:
+                direct.append(pair[0])
+            if pair[1] is not None:
+                proxied.append(pair[1])
+            if None not in pair:
+                differences.append(pair[1] - pair[0])
+
+        tasks = []
+        started = time.perf_counter()
+        for i in range(int(rate * duration)):
+            scheduled = started + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+            tasks.append(asyncio.create_task(fire(scheduled, i)))
+        await asyncio.gather(*tasks)
+        return {"direct_ms": percentiles(direct), "proxied_ms": percentiles(proxied),
+                "overhead_ms": percentiles(differences), "errors": errors,
+                "generator_lag_ms": round(lag * 1000, 3)}
+
+    @staticmethod
+    async def closed_loop(session: aiohttp.ClientSession, url: str, concurrency: int, duration: float) -> dict:
+        done, errors = 0, 0
+        stop_at = time.perf_counter() + duration
+
+        async def client():
+            nonlocal done, errors
+            while time.perf_counter() < stop_at:
+                try:
+                    async with session.get(url) as resp:
+                        await resp.read()
+                        if resp.status == 200:
+                            done += 1
+                        else:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return {"requests": done, "errors": errors, "rps": round(done / elapsed, 1)}
+
+    # --- фазы ---
+
+    async def overhead(self, session: aiohttp.ClientSession) -> dict:
+        url = f"{self.stub}/overhead/item"
+        # Прогрев: соединения лимитера к подменному API и кэш поиска идентификатора
+        await self.open_loop(session, self.proxied(url), 50, 0.5)
+        pairs = await self.paired_loop(session, url, self.proxied(url), self.args.rate, self.args.duration)
+        return {"rate": self.args.rate, "duration": self.args.duration, **pairs}
+
+    async def throughput(self, session: aiohttp.ClientSession) -> dict:
+        url = f"{self.stub}/overhead/item"
+        concurrency, duration = self.args.concurrency, self.args.duration
+        return {
+            "concurrency": concurrency,
+            "direct": await self.closed_loop(session, url, concurrency, duration),
+            "proxied": await self.closed_loop(session, self.proxied(url), concurrency, duration),
+        }
+
+    async def compliance(self, session: aiohttp.ClientSession) -> dict:
+        limit, period = self.args.compliance_limit, self.args.compliance_period
+        tolerance = self.args.compliance_tolerance
+        interval = period / limit
+        offered = 3 * limit / period
+        async with session.post(f"{self.stub}/_reset"):
+            pass
+        load = await self.open_loop(session, self.proxied(f"{self.stub}/compliance/item"), offered,
+                                    self.args.compliance_duration)
+        async with session.get(f"{self.stub}/_log", params={"key": "compliance"}) as resp:
+            arrivals = sorted(await resp.json())
+        async with session.get(f"{self.stub}/_stats") as resp:
+            throttled = (await resp.json()).get("compliance", {}).get("throttled", 0)
+
+        # Наибольшее число запросов в окне period, суженном на допуск сети, как у лимита подменного API
+        max_in_window, start = 0, 0
+        for end, arrived in enumerate(arrivals):
+            while arrived - arrivals[start] >= period - tolerance:
+                start += 1
+            max_in_window = max(max_in_window, end - start + 1)
+        gaps = [b - a for a, b in zip(arrivals, arrivals[1:])]
+        min_gap = min(gaps) if gaps else None
+        span = arrivals[-1] - arrivals[0] if len(arrivals) > 1 else 0
+        # Минимальный интервал между приходами зависит от задержек сети и выводится только для справки
+        passed = throttled == 0 and max_in_window <= limit
+        return {
+            "limit": limit,
+            "period": period,
+            "interval": interval,
+            "tolerance": tolerance,
+            "offered_rps": offered,
+            "upstream_requests": len(arrivals),
+            "upstream_rps": round((len(arrivals) - 1) / span, 3) if span else None,
+            "max_in_window": max_in_window,
+            "min_gap_ms": None if min_gap is None else round(min_gap * 1000, 3),
+            "upstream_429": throttled,
+            "client_latency_ms": load["latency_ms"],
+            "client_errors": load["errors"],
+            "passed": passed,
+        }
+
+    async def idle_cpu(self) -> dict:
+        pid = self.limiter_process.pid
+        before, started = cpu_seconds(pid), time.perf_counter()
+        await asyncio.sleep(self.args.idle)
+        after, elapsed = cpu_seconds(pid), time.perf_counter() - started
+        if before is None or after is None:
+            return {"seconds": self.args.idle, "cpu_percent": None}
+        return {"seconds": self.args.idle, "cpu_percent": round((after - before) / elapsed * 100, 3)}
+
+    async def queue_depth(self, session: aiohttp.ClientSession, path: str) -> int:
+        async with session.get(f"{self.limiter}/admin/metrics") as resp:
+            text = await resp.text()
+        for line in text.splitlines():
+            if line.startswith("ratelimiter_queue_depth{") and path in line:
+                return int(float(line.rsplit(" ", 1)[1]))
+        return 0
+
+    async def memory(self, session: aiohttp.ClientSession) -> dict:
+        pid, count = self.limiter_process.pid, self.args.queued
+        url = f"{self.stub}/memory"
+        before = rss_bytes(pid)
+        specs = [{"url": f"{url}/item", "params": {"i": i}} for i in range(count)]
+        # Первый запрос уходит сразу, остальные ждут час в очереди, пока соединение не будет закрыто
+        batch = await session.post(f"{self.limiter}/batch", json=specs)
+        try:
+            deadline = time.monotonic() + 60
+            depth = 0
+            while time.monotonic() < deadline:
+                depth = await self.queue_depth(session, url)
+                if depth >= count - 1:
+                    break
+                await asyncio.sleep(0.1)
+            after = rss_bytes(pid)
+        finally:
+            batch.close()
+        if before is None or after is None:
+            return {"queued": depth, "rss_before": before, "rss_after": after, "bytes_per_request": None}
+        return {"queued": depth, "rss_before": before, "rss_after": after,
+                "bytes_per_request": round((after - before) / max(depth, 1))}
+
+    async def run(self) -> dict:
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+            await self.start(session)
+            result = {
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "stub_latency": self.args.latency,
+            }
+            result["overhead"] = await self.overhead(session)
+            result["throughput"] = await self.throughput(session)
+            result["compliance"] = await self.compliance(session)
+            result["idle_cpu"] = await self.idle_cpu()
+            result["memory"] = await self.memory(session)
+            return result
+
+
+def summary(result: dict) -> str:
+    overhead, throughput = result["overhead"], result["throughput"]
+    compliance, memory = result["compliance"], result["memory"]
+    return "\n".join([
+        f"overhead ms p50/p99/p999: {overhead['overhead_ms']['p50']} / {overhead['overhead_ms']['p99']}"
+        f" / {overhead['overhead_ms']['p999']} (при {overhead['rate']} пар запросов/с,"
+        f" p99 напрямую {overhead['direct_ms']['p99']}, через лимитер {overhead['proxied_ms']['p99']})",
+        f"throughput: {throughput['proxied']['rps']} запросов/с через лимитер,"
+        f" {throughput['direct']['rps']} напрямую (concurrency {throughput['concurrency']})",
+        f"compliance: {'OK' if compliance['passed'] else 'FAIL'} - не больше {compliance['max_in_window']}"
+        f" из {compliance['limit']} за {compliance['period']} с, минимальный интервал {compliance['min_gap_ms']} мс,"
+        f" 429: {compliance['upstream_429']}",
+        f"memory: {memory['bytes_per_request']} байт на запрос в очереди ({memory['queued']} запросов)",
+        f"idle cpu: {result['idle_cpu']['cpu_percent']}%",
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер лимитера и проверка соблюдения лимитов")
+    parser.add_argument("--quick", action="store_true", help="короткий прогон для проверки")
+    parser.add_argument("--output", help="файл для JSON вместо stdout")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка подменного API, секунды")
+    parser.add_argument("--rate", type=float, default=200, help="пар запросов в секунду в открытом цикле overhead")
+    parser.add_argument("--duration", type=float, default=10, help="длительность overhead и throughput")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--compliance-limit", type=int, default=20)
+    parser.add_argument("--compliance-period", type=float, default=1.0)
+    parser.add_argument("--compliance-duration", type=float, default=5)
+    parser.add_argument("--compliance-tolerance", type=float, default=0.02,
+                        help="допуск на неравномерность сети: окно проверки и лимита подменного API короче period")
+    parser.add_argument("--idle", type=float, default=5, help="длительность замера простоя, секунды")
+    parser.add_argument("--queued", type=int, default=5000, help="запросов в очереди для замера памяти")
+    args = parser.parse_args()
+    if args.quick:
+        args.duration, args.compliance_duration, args.idle, args.queued = 2, 2, 2, 1000
+
+    bench = Bench(args)
+    try:
+        result = asyncio.run(bench.run())
+    finally:
+        bench.stop()
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf8")
+    else:
+        print(output)
+    print(summary(result), file=sys.stderr)
+    sys.exit(0 if result["compliance"]["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
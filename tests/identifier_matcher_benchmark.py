@@ -0,0 +1,42 @@
+"""
+Замер времени поиска идентификатора в зависимости от количества зарегистрированных API.
+
+Запуск из корня репозитория:
+    python -m tests.identifier_matcher_benchmark
+"""
+import json
+import random
+import time
+
+from services.identifier_matcher import IdentifierMatcher
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+LOOKUPS = 20_000
+
+
+def build_matcher(size: int) -> tuple[IdentifierMatcher, list[str]]:
+    matcher = IdentifierMatcher(api_manager=None)
+    urls = []
+    for i in range(size):
+        url = f"https://api{i % 100}.example.com/v{i % 3}/resource{i}"
+        matcher.register(json.dumps({"extra": "", "method": "ANY", "url": url}, sort_keys=True))
+        urls.append(url)
+    return matcher, urls
+
+
+def bench(size: int) -> float:
+    matcher, urls = build_matcher(size)
+    requests = [f"{random.choice(urls)}/items/{i}?page=2" for i in range(LOOKUPS)]
+
+    start = time.perf_counter()
+    for url in requests:
+        if matcher.find_identifier(url, "GET", "") is None:
+            raise RuntimeError(f"Идентификатор не найден для {url}")
+    return (time.perf_counter() - start) / LOOKUPS * 1e6
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    print(f"{'identifiers':>12} | {'us/lookup':>10}")
+    for size in SIZES:
+        print(f"{size:>12} | {bench(size):>10.2f}")
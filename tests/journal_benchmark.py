@@ -0,0 +1,62 @@
+"""
+Замер журнала запросов: сколько записей в секунду принимает append в потоке event loop
+и за сколько они оказываются на диске (групповой fsync), затем - восстановление незавершённых.
+
+Запуск: python -m tests.journal_benchmark
+"""
+import asyncio
+import shutil
+import tempfile
+import time
+
+from services.request_journal import RequestJournal, encode_body
+
+RECORDS = 100_000
+
+
+def make_record(i: int) -> dict:
+    return {
+        "api": '{"extra": "", "method": "ANY", "url": "https://api.example.com"}',
+        "method": "POST",
+        "url": "https://api.example.com/v1/jobs",
+        "headers": {"content-type": "application/json", "authorization": "Bearer token"},
+        "params": [["page", str(i)]],
+        "body": encode_body(b'{"job": %d}' % i),
+        "priority": 0,
+        "tenant": "",
+        "deadline": None,
+    }
+
+
+async def main():
+    path = tempfile.mkdtemp(prefix="journal-")
+    try:
+        journal = RequestJournal(path, 16 * 1024 * 1024)
+        journal.recover()
+        records = [make_record(i) for i in range(RECORDS)]
+
+        started = time.perf_counter()
+        ids = [journal.append(record) for record in records]
+        appended = time.perf_counter() - started
+        await journal.synced()
+        synced = time.perf_counter() - started
+        print(f"append: {RECORDS / appended:,.0f} записей/с, на диске через {synced:.2f} с")
+
+        started = time.perf_counter()
+        for record_id in ids[:RECORDS // 2]:
+            journal.complete(record_id)
+        await journal.synced()
+        print(f"complete: {RECORDS // 2 / (time.perf_counter() - started):,.0f} записей/с")
+        journal.close()
+
+        started = time.perf_counter()
+        journal = RequestJournal(path, 16 * 1024 * 1024)
+        recovered = journal.recover()
+        print(f"recover: {len(recovered)} незавершённых за {time.perf_counter() - started:.2f} с")
+        journal.close()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+"""
+Замер стоимости вызова logger.info для вызывающего потока в режимах логирования:
+sync, async, async с форматом json и выключенный уровень (WARNING).
+
+Каждый режим запускается в отдельном процессе: режим читается из окружения при импорте logger.
+Консольный вывод процессов отбрасывается, записи попадают в logs/app.log.
+
+Запуск: python -m tests.logging_benchmark
+"""
+import os
+import subprocess
+import sys
+import time
+
+CALLS = 20_000
+
+MODES = {
+    "sync": {"RATELIMITER_LOG_MODE": "sync"},
+    "async": {"RATELIMITER_LOG_MODE": "async"},
+    "async json": {"RATELIMITER_LOG_MODE": "async", "RATELIMITER_LOG_FORMAT": "json"},
+    "level WARNING": {"RATELIMITER_LOG_MODE": "sync", "RATELIMITER_LOG_LEVEL": "WARNING"},
+}
+
+
+def child():
+    from logger import setup_logger
+
+    logger = setup_logger("tests.logging_benchmark")
+    started = time.perf_counter()
+    for i in range(CALLS):
+        logger.info("Worker %s found task with priority %s: %s, %s", "benchmark", i, "GET", "http://example.com")
+    elapsed = time.perf_counter() - started
+    print(f"{elapsed / CALLS * 1e6:.2f}", file=sys.stderr)
+
+
+def main():
+    print(f"{'режим':>14} {'us на вызов':>12}")
+    for name, env in MODES.items():
+        result = subprocess.run(
+            [sys.executable, "-m", "tests.logging_benchmark", "--child"],
+            env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        print(f"{name:>14} {result.stderr.strip().splitlines()[-1]:>12}")
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        child()
+    else:
+        main()
@@ -0,0 +1,63 @@
+"""
+Замер очередей запросов: время put/get на элемент при 1k-100k ожидающих запросах
+и доли отправок клиентов с разными весами в режиме fair_queuing.
+
+Запуск: python -m tests.queue_benchmark
+"""
+import asyncio
+import random
+import time
+from collections import Counter
+
+from models.api import Item
+from services.scheduling import AgingQueue, FairQueue
+
+SIZES = [1_000, 10_000, 100_000]
+TENANTS = [f"service-{i}" for i in range(100)]
+
+
+def make_items(n: int) -> list[Item]:
+    return [Item(-random.randint(0, 10), None, random.choice(TENANTS)) for _ in range(n)]
+
+
+def measure(queue: asyncio.Queue, items: list[Item]) -> tuple[float, float]:
+    started = time.perf_counter()
+    for item in items:
+        queue.put_nowait(item)
+    put = (time.perf_counter() - started) / len(items)
+
+    started = time.perf_counter()
+    while not queue.empty():
+        queue.get_nowait()
+    get = (time.perf_counter() - started) / len(items)
+    return put * 1e6, get * 1e6
+
+
+def fairness() -> Counter:
+    """Два клиента с весами 3 и 1 и одинаково длинными очередями: первые 400 отправок делятся 3:1."""
+    queue = FairQueue(weights={"heavy": 3, "light": 1})
+    for _ in range(1000):
+        queue.put_nowait(Item(0, None, "heavy"))
+        queue.put_nowait(Item(0, None, "light"))
+    return Counter(queue.get_nowait().tenant for _ in range(400))
+
+
+async def main():
+    random.seed(1)
+    print(f"{'размер':>8} {'очередь':>22} {'put, us':>8} {'get, us':>8}")
+    for size in SIZES:
+        items = make_items(size)
+        queues = {
+            "PriorityQueue": asyncio.PriorityQueue(),
+            "AgingQueue": AgingQueue(aging_rate=1.0),
+            "FairQueue": FairQueue(aging_rate=1.0, weights={TENANTS[0]: 5}),
+        }
+        for name, queue in queues.items():
+            put, get = measure(queue, items)
+            print(f"{size:>8} {name:>22} {put:>8.2f} {get:>8.2f}")
+
+    print(f"Доли отправок при весах 3:1: {dict(fairness())}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
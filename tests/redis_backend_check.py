@@ -0,0 +1,99 @@
+"""
+Проверка RedisBackend: несколько "узлов" лимитера с общим состоянием на подменном Redis-сервере.
+
+Каждый узел - отдельное соединение и свой API с тем же идентификатором.
+Проверяется, что занятые всеми узлами моменты отправки соблюдают правила, а RPD не превышается,
+и сколько команд к хранилищу приходится на один запрос при аренде разрешений пачками.
+
+Запуск: python -m tests.redis_backend_check
+С настоящим сервером: REDIS_URL=redis://127.0.0.1:6379/0 python -m tests.redis_backend_check
+"""
+import asyncio
+import os
+import time
+
+from models.api import API
+from schemas import APIModel
+from services.session_pool import SessionPool
+from services.state_backends import RedisBackend
+from tests.resp_server import RespServer
+
+NODES = 3
+DURATION = 3.0
+LIMIT, PERIOD = 20, 1.0
+RPD = 500
+
+CONFIG = {
+    "identifier": {"url": "http://127.0.0.1:8889/redis_check"},
+    "rate_limit": {
+        "interval": 0.001,
+        "RPD": RPD,
+        "limits": [{"type": "sliding_window_log", "limit": LIMIT, "period": PERIOD}],
+    },
+}
+
+
+async def node(api: API, sent: list, lateness: list, deadline: float):
+    """Упрощённый цикл worker: очередь всегда полна, отправка - запись занятого момента."""
+    while time.time() < deadline:
+        delay = await api.limiter.delay(time.time())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        send_at = await api.limiter.acquire(time.time(), demand=100)
+        if send_at > time.time():
+            await asyncio.sleep(send_at - time.time())
+        sent.append(send_at)
+        lateness.append(time.time() - send_at)
+
+
+def max_in_window(times: list, period: float) -> int:
+    times = sorted(times)
+    best, start = 0, 0
+    for end, t in enumerate(times):
+        while t - times[start] >= period:
+            start += 1
+        best = max(best, end - start + 1)
+    return best
+
+
+async def main():
+    server = None
+    url = os.environ.get("REDIS_URL")
+    if url is None:
+        server = await RespServer().start()
+        url = server.url
+
+    stop_event = asyncio.Event()
+    session_pool = SessionPool()
+    prefix = f"check:{time.time()}:"
+    backends = [RedisBackend(url, prefix, lease_size=10) for _ in range(NODES)]
+    apis = [API(APIModel(**CONFIG), stop_event, session_pool, backend) for backend in backends]
+
+    sent: list[float] = []
+    lateness: list[float] = []
+    started = time.time()
+    await asyncio.gather(*[node(api, sent, lateness, started + DURATION) for api in apis])
+    worst = max_in_window(sent, PERIOD)
+    print(f"Отправлено {len(sent)} за {DURATION}s на {NODES} узлах, "
+          f"максимум в окне {PERIOD}s: {worst} (лимит {LIMIT}), "
+          f"наибольшее опоздание отправки {max(lateness) * 1000:.1f}ms")
+
+    accepted = 0
+    for _ in range(RPD // NODES + 50):
+        for api in apis:
+            accepted += await api.reserve_daily()
+    print(f"Принято по RPD: {accepted} (лимит {RPD})")
+
+    if server is not None:
+        print(f"Команд к хранилищу: {server.commands}, на один запрос: {server.commands / (len(sent) + accepted):.2f}")
+        await server.stop()
+    for backend in backends:
+        await backend.close()
+
+    assert worst <= LIMIT, "превышен лимит скользящего окна"
+    assert accepted == RPD, "RPD не соблюдён"
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Замер накладных расходов на подготовку одного проксируемого запроса:
+поиск идентификатора и сборка запроса до постановки в очередь.
+
+"before" - прежний путь через find_identifier и pydantic-модель запроса (RequestIdentifierModel,
+которой в сервисе больше нет, поэтому она описана здесь), "after" - resolve с кэшем и ProxyRequest.
+
+Запуск из корня репозитория:
+    python -m tests.request_overhead_benchmark
+"""
+import json
+import time
+from typing import Annotated, Any
+
+from pydantic import AnyHttpUrl, BaseModel, PlainSerializer
+from starlette.requests import Request
+
+from models.proxy_request import ProxyRequest
+from schemas import HTTP_METHODS_LITERAL, IdentifierType
+from services.identifier_matcher import IdentifierMatcher
+from services.requester import filter_headers
+
+ITERATIONS = 20_000
+IDENTIFIER_URL = "http://127.0.0.1:8889/limited2secs"
+URL = f"{IDENTIFIER_URL}/items/42"
+
+
+class RequestModel(BaseModel):
+    url: Annotated[AnyHttpUrl, PlainSerializer(str)]
+    method: HTTP_METHODS_LITERAL
+    headers: dict = {}
+    params: dict = {}
+    data: Any = None
+
+
+class RequestIdentifierModel(BaseModel):
+    identifier: IdentifierType
+    request: RequestModel
+    priority: int = 0
+
+
+class _Manager:
+    """Заглушка APIManager: любой зарегистрированный ключ указывает на один и тот же API."""
+
+    def get(self, identifier_key):
+        return object()
+
+
+def build_request() -> Request:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": f"/{URL}",
+        "query_string": b"id=1&page=2",
+        "headers": [
+            (b"host", b"127.0.0.1:8000"),
+            (b"user-agent", b"bench"),
+            (b"accept", b"*/*"),
+            (b"x-priority", b"3"),
+        ],
+    }
+    return Request(scope)
+
+
+def before(matcher: IdentifierMatcher, request: Request):
+    headers = dict(request.headers)
+    ide_extra = headers.pop('x-identifier-extra', "")
+    ide = matcher.find_identifier(URL, request.method, ide_extra, first_match_only=True)
+    priority = int(headers.pop('x-priority', 0))
+    req = RequestIdentifierModel(
+        identifier=ide,
+        request={
+            "url": URL,
+            "method": request.method,
+            "headers": headers,
+            "params": request.query_params,
+        },
+        priority=priority,
+    )
+    return req.request.model_dump()
+
+
+def after(matcher: IdentifierMatcher, request: Request):
+    headers = filter_headers(request.headers)
+    headers.pop('host', None)
+    ide_extra = headers.pop('x-identifier-extra', "")
+    _, api = matcher.resolve(URL, request.method, ide_extra)
+    priority = int(headers.pop('x-priority', 0))
+    return ProxyRequest(URL, request.method, headers, request.query_params.multi_items(), None, None, time.monotonic())
+
+
+def bench(func, matcher: IdentifierMatcher) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        func(matcher, build_request())
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+if __name__ == "__main__":
+    matcher = IdentifierMatcher(_Manager())
+    matcher.register(json.dumps({"extra": "", "method": "ANY", "url": IDENTIFIER_URL}, sort_keys=True))
+
+    baseline = bench(lambda m, r: None, matcher)
+    old = bench(before, matcher) - baseline
+    new = bench(after, matcher) - baseline
+    print(f"before: {old:.2f} us/request")
+    print(f"after:  {new:.2f} us/request")
+    print(f"speedup: {old / new:.1f}x")
@@ -0,0 +1,128 @@
+"""
+Подменный Redis-совместимый сервер для проверки RedisBackend без настоящего Redis.
+
+Поддерживает команды, которые использует лимитер: PING, AUTH, SELECT, GET, SET, DEL,
+WATCH, UNWATCH, MULTI, EXEC, DISCARD. Данные хранятся в памяти процесса.
+
+Запуск отдельно: python -m tests.resp_server [port]
+"""
+import asyncio
+import sys
+
+from services.resp_client import RespError, read_reply
+
+
+def _encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode_reply(item) for item in value)
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespServer:
+    """In-process сервер: start() открывает порт в текущем event loop."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._data: dict[bytes, bytes] = {}
+        # Версия ключа растёт при каждой записи: по ней EXEC узнаёт, менялись ли наблюдаемые ключи
+        self._versions: dict[bytes, int] = {}
+        self._server = None
+        self.commands = 0
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def start(self) -> "RespServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _write(self, key: bytes, value) -> None:
+        if value is None:
+            self._data.pop(key, None)
+        else:
+            self._data[key] = value
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _run(self, command: list, watched: dict):
+        name = command[0].upper()
+        if name == b"PING":
+            return "PONG"
+        if name in (b"AUTH", b"SELECT"):
+            return "OK"
+        if name == b"GET":
+            return self._data.get(command[1])
+        if name == b"SET":
+            self._write(command[1], command[2])
+            return "OK"
+        if name == b"DEL":
+            existed = [key for key in command[1:] if key in self._data]
+            for key in existed:
+                self._write(key, None)
+            return len(existed)
+        if name == b"WATCH":
+            for key in command[1:]:
+                watched.setdefault(key, self._versions.get(key, 0))
+            return "OK"
+        if name == b"UNWATCH":
+            watched.clear()
+            return "OK"
+        return RespError(f"ERR unknown command '{name.decode()}'")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        watched: dict[bytes, int] = {}
+        queued = None
+        try:
+            while True:
+                command = await read_reply(reader)
+                self.commands += 1
+                name = command[0].upper()
+                if name == b"MULTI":
+                    queued, reply = [], "OK"
+                elif name == b"DISCARD":
+                    queued, reply = None, "OK"
+                    watched.clear()
+                elif name == b"EXEC":
+                    if queued is None:
+                        reply = RespError("ERR EXEC without MULTI")
+                    elif any(self._versions.get(key, 0) != version for key, version in watched.items()):
+                        reply = None
+                    else:
+                        reply = [self._run(queued_command, watched) for queued_command in queued]
+                    queued = None
+                    watched.clear()
+                elif queued is not None:
+                    queued.append(command)
+                    reply = "QUEUED"
+                else:
+                    reply = self._run(command, watched)
+                writer.write(_encode_reply(reply))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def main(port: int):
+    server = await RespServer(port=port).start()
+    print(f"Подменный Redis слушает {server.url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 6379))
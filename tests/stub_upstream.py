@@ -0,0 +1,103 @@
+"""
+Подменный внешний API для замеров и ручной проверки лимитера.
+
+Отвечает JSON с путём и параметрами через заданную задержку, на любой путь и метод.
+Лимиты задаются по первому сегменту пути: --limit compliance=20/1 - не больше 20 запросов за любую секунду
+на /compliance/..., сверх лимита - 429. Время каждого запроса запоминается для проверки соблюдения лимитов.
+--tolerance - допуск на неравномерность сети: окно лимита короче period на столько секунд, чтобы запросы,
+отправленные ровно через period, но пришедшие чуть ближе друг к другу, не получали 429.
+
+Служебные пути:
+- GET /_log?key=compliance - моменты поступления запросов (unix timestamp)
+- GET /_stats - число запросов и ответов 429 по ключам
+- POST /_reset - очистить журнал
+
+Запуск: python -m tests.stub_upstream --port 8889 --latency 0.01 --limit compliance=20/1 --tolerance 0.02
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+
+class StubUpstream:
+    def __init__(self, latency: float = 0.0, limits: dict[str, tuple[int, float]] = None, tolerance: float = 0.0):
+        self.latency = latency
+        self.limits = limits or {}
+        self.tolerance = tolerance
+        self.arrivals: dict[str, list[float]] = defaultdict(list)
+        self.throttled: dict[str, int] = defaultdict(int)
+        self._windows: dict[str, deque] = defaultdict(deque)
+
+    def _allowed(self, key: str, now: float) -> bool:
+        if key not in self.limits:
+            return True
+        limit, period = self.limits[key]
+        window = self._windows[key]
+        while window and window[0] <= now - (period - self.tolerance):
+            window.popleft()
+        if len(window) >= limit:
+            return False
+        window.append(now)
+        return True
+
+    async def handle(self, request: web.Request) -> web.Response:
+        now = time.time()
+        key = request.path.strip("/").split("/", 1)[0]
+        self.arrivals[key].append(now)
+        await request.read()
+        if not self._allowed(key, now):
+            self.throttled[key] += 1
+            return web.json_response({"msg": "Too Many Requests"}, status=429, headers={"Retry-After": "1"})
+        latency = float(request.query.get("latency", self.latency))
+        if latency > 0:
+            await asyncio.sleep(latency)
+        return web.json_response({"path": request.path, "query": dict(request.query)})
+
+    async def log(self, request: web.Request) -> web.Response:
+        return web.json_response(self.arrivals.get(request.query.get("key", ""), []))
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            key: {"requests": len(times), "throttled": self.throttled.get(key, 0)}
+            for key, times in self.arrivals.items()
+        })
+
+    async def reset(self, request: web.Request) -> web.Response:
+        self.arrivals.clear()
+        self.throttled.clear()
+        self._windows.clear()
+        return web.json_response({})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/_log", self.log)
+        app.router.add_get("/_stats", self.stats)
+        app.router.add_post("/_reset", self.reset)
+        app.router.add_route("*", "/{tail:.*}", self.handle)
+        return app
+
+
+def parse_limit(value: str) -> tuple[str, tuple[int, float]]:
+    key, _, spec = value.partition("=")
+    limit, _, period = spec.partition("/")
+    return key, (int(limit), float(period or 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подменный внешний API")
+    parser.add_argument("--port", type=int, default=8889)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--limit", action="append", default=[], type=parse_limit,
+                        help="лимит по первому сегменту пути: key=N/period")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="допуск на неравномерность сети: окно лимита короче period на столько секунд")
+    args = parser.parse_args()
+    stub = StubUpstream(args.latency, dict(args.limit), args.tolerance)
+    web.run_app(stub.app(), host="127.0.0.1", port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()